@@ -1,52 +1,176 @@
 import httpx
 import asyncio
+import sys
+import time
 
 # URL base do servidor
 BASE_URL = "http://127.0.0.1:8000"
 
+# Limites do pool de conexões e da concorrência das operações em lote
+MAX_CONNECTIONS = 20
+MAX_KEEPALIVE = 20
+CONCURRENCY = 10
 
-async def create_item(item_id: int, name: str, description: str):
-    async with httpx.AsyncClient() as client:
-        response = await client.post(f"{BASE_URL}/items/",
-                                     json={"id": item_id, "name": name, "description": description})
-        print("Created item:", response.json())
 
+class ItemsClient:
+    """
+    Um AsyncClient para todas as chamadas: as conexões ficam abertas (keep-alive)
+    e são reaproveitadas em vez de abrir e fechar uma por requisição.
 
-async def get_all_items():
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{BASE_URL}/items/")
-        print("All items:", response.json())
+        async with ItemsClient() as items:
+            await items.create_item(1, "Item 1", "A sample item")
+            await items.get_many(range(1, 100))
+    """
 
+    def __init__(self, base_url=BASE_URL, max_connections=MAX_CONNECTIONS,
+                 max_keepalive=MAX_KEEPALIVE, concurrency=CONCURRENCY, timeout=10):
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+        )
+        self.concurrency = concurrency
 
-async def get_item(item_id: int):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(f"{BASE_URL}/items/{item_id}")
-        print(f"Item {item_id}:", response.json())
+    async def __aenter__(self):
+        return self
 
+    async def __aexit__(self, *exc):
+        await self.close()
 
-async def update_item(item_id: int, name: str, description: str):
-    async with httpx.AsyncClient() as client:
-        response = await client.put(f"{BASE_URL}/items/{item_id}",
-                                    json={"id": item_id, "name": name, "description": description})
-        print("Updated item:", response.json())
+    async def close(self):
+        await self.client.aclose()
 
+    async def create_item(self, item_id: int, name: str, description: str):
+        response = await self.client.post("/items/", json={"id": item_id, "name": name, "description": description})
+        return response.json()
 
-async def delete_item(item_id: int):
-    async with httpx.AsyncClient() as client:
-        response = await client.delete(f"{BASE_URL}/items/{item_id}")
-        print("Delete response:", response.json())
+    # O servidor devolve uma página por vez; segue o X-Next-Cursor até a última
+    async def get_all_items(self, page_size=1000):
+        items = []
+        params = {"limit": page_size}
+        while True:
+            response = await self.client.get("/items/", params=params)
+            items.extend(response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                return items
+            params["cursor"] = cursor
+
+    async def get_item(self, item_id: int):
+        response = await self.client.get(f"/items/{item_id}")
+        return response.json()
+
+    async def update_item(self, item_id: int, name: str, description: str):
+        response = await self.client.put(f"/items/{item_id}",
+                                         json={"id": item_id, "name": name, "description": description})
+        return response.json()
+
+    async def delete_item(self, item_id: int):
+        response = await self.client.delete(f"/items/{item_id}")
+        return response.json()
+
+    # Uma requisição para a lista inteira (tudo ou nada no servidor)
+    # items: (id, name, description)
+    async def create_bulk(self, items):
+        response = await self.client.post(
+            "/items/bulk", json=[{"id": i, "name": name, "description": description} for i, name, description in items])
+        return response.json()
+
+    async def update_bulk(self, items):
+        response = await self.client.put(
+            "/items/bulk", json=[{"id": i, "name": name, "description": description} for i, name, description in items])
+        return response.json()
+
+    async def delete_bulk(self, item_ids):
+        response = await self.client.request("DELETE", "/items/bulk", json=list(item_ids))
+        return response.json()
+
+    # Roda as corrotinas com no máximo `concurrency` requisições ao mesmo tempo, na ordem de entrada
+    async def _gather(self, coroutines, concurrency=None):
+        semaphore = asyncio.Semaphore(concurrency or self.concurrency)
+
+        async def limited(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        return await asyncio.gather(*(limited(coroutine) for coroutine in coroutines))
+
+    # items: (id, name, description)
+    async def create_many(self, items, concurrency=None):
+        return await self._gather((self.create_item(*item) for item in items), concurrency)
+
+    async def get_many(self, item_ids, concurrency=None):
+        return await self._gather((self.get_item(item_id) for item_id in item_ids), concurrency)
+
+    async def delete_many(self, item_ids, concurrency=None):
+        return await self._gather((self.delete_item(item_id) for item_id in item_ids), concurrency)
 
 
 # Executando as operações
 async def main():
-    await create_item(1, "Item 1", "A sample item")
-    await get_all_items()
-    await get_item(1)
-    await update_item(1, "Updated Item 1", "An updated sample item")
-    await get_item(1)
-    await delete_item(1)
-    await get_all_items()
+    async with ItemsClient() as items:
+        print("Created item:", await items.create_item(1, "Item 1", "A sample item"))
+        print("All items:", await items.get_all_items())
+        print("Item 1:", await items.get_item(1))
+        print("Updated item:", await items.update_item(1, "Updated Item 1", "An updated sample item"))
+        print("Item 1:", await items.get_item(1))
+        print("Delete response:", await items.delete_item(1))
+        print("All items:", await items.get_all_items())
+
+
+# Benchmark contra o servidor local (uvicorn server:app): python client.py bench [operações]
+async def bench(total):
+    first_id = 1_000_000
+
+    async def unpooled_get(item_id):
+        async with httpx.AsyncClient() as client:
+            return (await client.get(f"{BASE_URL}/items/{item_id}")).json()
+
+    def report(name, count, elapsed):
+        print(f"{name:<32} {count:>6} ops em {elapsed:6.2f}s -> {count / elapsed:8.0f} ops/s")
+
+    async with ItemsClient() as items:
+        ids = range(first_id, first_id + total)
+        start = time.perf_counter()
+        await items.create_many((item_id, f"Item {item_id}", "bench") for item_id in ids)
+        report("create_many", total, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await items.get_many(ids)
+        report("get_many", total, time.perf_counter() - start)
+
+        sample = ids[:max(total // 10, 1)]
+        start = time.perf_counter()
+        for item_id in sample:
+            await items.get_item(item_id)
+        report("get_item em série (pool)", len(sample), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for item_id in sample:
+            await unpooled_get(item_id)
+        report("get_item em série (sem pool)", len(sample), time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await items.delete_many(ids)
+        report("delete_many", total, time.perf_counter() - start)
+
+        rows = [(item_id, f"Item {item_id}", "bench") for item_id in ids]
+        start = time.perf_counter()
+        await items.create_bulk(rows)
+        report("create_bulk (1 requisição)", total, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await items.get_all_items()
+        report("get_all_items (páginas de 1000)", total, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await items.delete_bulk(ids)
+        report("delete_bulk (1 requisição)", total, time.perf_counter() - start)
 
 
 # Rodar o cliente
-asyncio.run(main())
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["bench"]:
+        asyncio.run(bench(int(sys.argv[2]) if len(sys.argv) > 2 else 2000))
+    else:
+        asyncio.run(main())
@@ -1,8 +1,34 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import List
+import os
+import sys
+from contextlib import asynccontextmanager
+from fastapi import Body, FastAPI, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, TypeAdapter
+from typing import List, Optional
 
-app = FastAPI()
+from storage import Storage
+from store import ItemStore
+
+# fast_json.py fica em api_httpx, um nível acima
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fast_json import BodyCache, FastJSONResponse  # noqa: E402
+
+
+# Carrega os itens do banco ao subir e grava as escritas pendentes ao descer
+@asynccontextmanager
+async def lifespan(app):
+    await storage.start()
+    yield
+    await storage.stop()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+
+# Paginação da listagem
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STREAM_MIN_ITEMS = 200  # Com limit maior que isso a página vai em streaming, sem cache
+STREAM_CHUNK_ITEMS = 100  # Itens por pedaço do streaming
 
 
 # Modelo do Item
@@ -12,23 +38,104 @@ class Item(BaseModel):
     description: str = "No description provided"
 
 
-# Banco de dados simulado
-items_db = {}
+# Itens em memória, com índices por nome e por palavras da descrição; as
+# escritas passam por `storage`, que grava no SQLite (ITEMS_STORAGE=memory|sync|batched).
+# Os itens vivem neste processo: rode um processo só (uvicorn sem --workers),
+# senão cada worker tem sua cópia e não vê as escritas dos outros
+items_db = ItemStore()
+storage = Storage(items_db, Item)
+
+# Páginas já serializadas, válidas enquanto items_db.version não mudar
+items_adapter = TypeAdapter(List[Item])
+pages = BodyCache()
 
 
 # Endpoint para criar um novo item
 @app.post("/items/", response_model=Item)
 async def create_item(item: Item):
-    if item.id in items_db:
-        raise HTTPException(status_code=400, detail="Item already exists")
-    items_db[item.id] = item
+    async with storage.write_lock:
+        if item.id in items_db:
+            raise HTTPException(status_code=400, detail="Item already exists")
+        await storage.put([item])
     return item
 
 
-# Endpoint para ler todos os itens
+# Endpoint para ler os itens, uma página por vez
+# cursor = último id da página anterior; o próximo vem no header X-Next-Cursor
+# Filtros: name (exato, ou prefixo terminando em "*") e q (palavras da descrição)
 @app.get("/items/", response_model=List[Item])
-async def read_items():
-    return list(items_db.values())
+async def read_items(request: Request, cursor: Optional[int] = None,
+                     limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT),
+                     name: Optional[str] = None, q: Optional[str] = None):
+    def select():
+        page, more = items_db.page(cursor, limit, name=name, q=q)
+        headers = {"X-Next-Cursor": str(page[-1])} if more else {}
+        return page, headers
+
+    # Páginas pequenas (o caso de quem fica consultando a lista): corpo em cache com ETag
+    if limit <= STREAM_MIN_ITEMS:
+        def build():
+            page, headers = select()
+            return items_adapter.dump_json([items_db[item_id] for item_id in page]), headers
+
+        return pages.response(request, (cursor, limit, name, q), items_db.version, build)
+
+    page, headers = select()
+
+    def chunks():
+        yield b"["
+        first = True
+        for i in range(0, len(page), STREAM_CHUNK_ITEMS):
+            # Item apagado depois que a página foi montada fica de fora
+            batch = [item for item in map(items_db.get, page[i:i + STREAM_CHUNK_ITEMS]) if item is not None]
+            if batch:
+                yield (b"" if first else b",") + items_adapter.dump_json(batch)[1:-1]
+                first = False
+        yield b"]"
+
+    return StreamingResponse(chunks(), media_type="application/json", headers=headers)
+
+
+# Operações em lote: tudo ou nada, a lista inteira é validada antes de mudar o banco
+# Toda escrita faz a checagem e a gravação dentro de storage.write_lock: a gravação
+# tem await (commit no modo sync, fila cheia no batched) e sem o lock duas
+# requisições com o mesmo id passariam as duas pela checagem
+def _check_unique(ids: List[int]):
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=400, detail="Duplicated ids in request")
+
+
+@app.post("/items/bulk")
+async def create_items(items: List[Item]):
+    _check_unique([item.id for item in items])
+    async with storage.write_lock:
+        existing = [item.id for item in items if item.id in items_db]
+        if existing:
+            raise HTTPException(status_code=400, detail={"message": "Items already exist", "ids": existing})
+        await storage.put(items)
+    return {"created": len(items)}
+
+
+@app.put("/items/bulk")
+async def update_items(items: List[Item]):
+    _check_unique([item.id for item in items])
+    async with storage.write_lock:
+        missing = [item.id for item in items if item.id not in items_db]
+        if missing:
+            raise HTTPException(status_code=404, detail={"message": "Items not found", "ids": missing})
+        await storage.put(items)
+    return {"updated": len(items)}
+
+
+@app.delete("/items/bulk")
+async def delete_items(ids: List[int] = Body(...)):
+    _check_unique(ids)
+    async with storage.write_lock:
+        missing = [item_id for item_id in ids if item_id not in items_db]
+        if missing:
+            raise HTTPException(status_code=404, detail={"message": "Items not found", "ids": missing})
+        await storage.delete(ids)
+    return {"deleted": len(ids)}
 
 
 # Endpoint para ler um item específico
@@ -43,16 +150,19 @@ async def read_item(item_id: int):
 # Endpoint para atualizar um item
 @app.put("/items/{item_id}", response_model=Item)
 async def update_item(item_id: int, item: Item):
-    if item_id not in items_db:
-        raise HTTPException(status_code=404, detail="Item not found")
-    items_db[item_id] = item
-    return item
+    async with storage.write_lock:
+        if item_id not in items_db:
+            raise HTTPException(status_code=404, detail="Item not found")
+        stored = item.model_copy(update={"id": item_id})
+        await storage.put([stored])
+    return stored
 
 
 # Endpoint para deletar um item
 @app.delete("/items/{item_id}")
 async def delete_item(item_id: int):
-    if item_id not in items_db:
-        raise HTTPException(status_code=404, detail="Item not found")
-    del items_db[item_id]
+    async with storage.write_lock:
+        if item_id not in items_db:
+            raise HTTPException(status_code=404, detail="Item not found")
+        await storage.delete([item_id])
     return {"message": "Item deleted successfully"}
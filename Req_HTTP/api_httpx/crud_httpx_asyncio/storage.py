@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Modos de gravação:
+#   memory   nada é gravado em disco (como antes)
+#   sync     cada escrita espera o commit no SQLite antes de responder
+#   batched  write-behind: responde na hora e uma tarefa grava as escritas
+#            pendentes juntas num commit só; um crash perde no máximo as
+#            escritas dos últimos milissegundos
+MODES = ("memory", "sync", "batched")
+DEFAULT_MODE = os.environ.get("ITEMS_STORAGE", "batched")
+DEFAULT_PATH = os.environ.get("ITEMS_DB", "items.db")
+
+FLUSH_DELAY = 0.005  # Espera para juntar mais escritas no mesmo commit
+MAX_PENDING = 10000  # Acima disso quem escreve espera o próximo commit
+RETRY_DELAY_MAX = 5.0  # Teto da espera entre tentativas quando o commit falha
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteBackend:
+    """
+    SQLite em WAL com uma thread só para o banco (a conexão não é
+    compartilhada entre threads) e interface async para o event loop.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, synchronous="NORMAL"):
+        self.path = path
+        self.synchronous = synchronous
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite")
+        self.conn = None
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT NOT NULL)")
+        return self.conn.execute("SELECT id, name, description FROM items ORDER BY id").fetchall()
+
+    # ops: {id: (name, description) ou None para apagar}, tudo numa transação
+    def _apply(self, ops):
+        puts = [(item_id, *values) for item_id, values in ops.items() if values is not None]
+        deletes = [(item_id,) for item_id, values in ops.items() if values is None]
+        self.conn.execute("BEGIN")
+        try:
+            if deletes:
+                self.conn.executemany("DELETE FROM items WHERE id = ?", deletes)
+            if puts:
+                self.conn.executemany("INSERT OR REPLACE INTO items (id, name, description) VALUES (?, ?, ?)", puts)
+            self.conn.execute("COMMIT")
+        except sqlite3.Error:
+            self.conn.execute("ROLLBACK")
+            raise
+
+    async def load(self):
+        return await self._run(self._open)
+
+    async def apply(self, ops):
+        await self._run(self._apply, ops)
+
+    async def close(self):
+        await self._run(self.conn.close)
+        self.executor.shutdown()
+
+
+class Storage:
+    """
+    Camada entre os endpoints e o banco. Todas as leituras vão para o
+    ItemStore em memória, carregado inteiro do SQLite no start(), então um
+    GET custa o mesmo que um dict. As escritas passam por put()/delete().
+
+    Não é um cache read-through: depois do start() o banco só é escrito,
+    nunca relido, e a checagem de id duplicado olha só a memória deste
+    processo. Rode um processo só por banco (uvicorn sem --workers); com
+    vários, um não vê as escritas do outro e dois POSTs com o mesmo id em
+    workers diferentes passam na checagem e o INSERT OR REPLACE de um
+    sobrescreve o outro sem erro.
+    """
+
+    def __init__(self, store, make_item, mode=DEFAULT_MODE, path=DEFAULT_PATH):
+        if mode not in MODES:
+            raise ValueError(f"invalid storage mode: {mode} (use {', '.join(MODES)})")
+        self.store = store
+        self.make_item = make_item
+        self.mode = mode
+        self.backend = None
+        if mode != "memory":
+            self.backend = SQLiteBackend(path, "FULL" if mode == "sync" else "NORMAL")
+        self.pending = {}  # Escritas ainda não gravadas: id -> (name, description) ou None
+        # Quem checa se um id existe e depois grava segura este lock até o fim da
+        # gravação; senão outra requisição com o mesmo id passa pela checagem no meio
+        self.write_lock = asyncio.Lock()
+        self.wakeup = asyncio.Event()
+        self.flushed = asyncio.Event()
+        self.flusher = None
+        self.stats = {"commits": 0, "writes": 0, "max_pending": 0}
+
+    async def start(self):
+        if self.backend is None:
+            return
+        for item_id, name, description in await self.backend.load():
+            self.store.add(self.make_item(id=item_id, name=name, description=description))
+        if self.mode == "batched":
+            self.flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self.flusher is not None:
+            self.flusher.cancel()
+            try:
+                await self.flusher
+            except asyncio.CancelledError:
+                pass
+            await self._flush()
+        if self.backend is not None:
+            await self.backend.close()
+
+    async def put(self, items):
+        await self._write({item.id: (item.name, item.description) for item in items})
+        for item in items:
+            if item.id in self.store:
+                self.store.replace(item.id, item)
+            else:
+                self.store.add(item)
+
+    async def delete(self, item_ids):
+        await self._write({item_id: None for item_id in item_ids})
+        for item_id in item_ids:
+            # Outra requisição pode ter apagado enquanto esta esperava o commit
+            if item_id in self.store:
+                self.store.remove(item_id)
+
+    async def _write(self, ops):
+        self.stats["writes"] += len(ops)
+        if self.mode == "sync":
+            await self.backend.apply(ops)
+            self.stats["commits"] += 1
+        elif self.mode == "batched":
+            while len(self.pending) >= MAX_PENDING:
+                self.flushed.clear()
+                await self.flushed.wait()
+            self.pending.update(ops)
+            self.stats["max_pending"] = max(self.stats["max_pending"], len(self.pending))
+            self.wakeup.set()
+
+    async def _flush(self):
+        ops, self.pending = self.pending, {}
+        try:
+            if ops:
+                await self.backend.apply(ops)
+                self.stats["commits"] += 1
+        except BaseException:
+            # Os clientes já receberam 200: as escritas voltam para a fila, sem
+            # sobrescrever as mais novas que chegaram para os mesmos ids
+            for item_id, values in ops.items():
+                self.pending.setdefault(item_id, values)
+            raise
+        finally:
+            self.flushed.set()
+
+    async def _flush_loop(self):
+        delay = FLUSH_DELAY
+        while True:
+            await self.wakeup.wait()
+            await asyncio.sleep(delay)
+            self.wakeup.clear()
+            try:
+                await self._flush()
+                delay = FLUSH_DELAY
+            except sqlite3.Error:
+                delay = min(max(delay * 2, 0.1), RETRY_DELAY_MAX)
+                logger.exception("Failed to write %d items to the database, retrying in %.1fs",
+                                 len(self.pending), delay)
+                self.wakeup.set()
+
+
+# Benchmark de durabilidade x vazão: python storage.py [escritas] [concorrência]
+async def bench(total, concurrency):
+    from server import Item
+    from store import ItemStore
+
+    directory = tempfile.mkdtemp()
+    for mode in MODES:
+        path = os.path.join(directory, f"{mode}.db")
+        storage = Storage(ItemStore(), Item, mode, path)
+        await storage.start()
+        items = [Item(id=i, name=f"item{i}", description="bench") for i in range(total)]
+        queue = iter(items)
+
+        # Cada escritor é um cliente: entre uma escrita e outra devolve o event
+        # loop, como uma requisição HTTP faria
+        async def writer():
+            for item in queue:
+                await storage.put([item])
+                await asyncio.sleep(0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(writer() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        await storage.stop()
+
+        start = time.perf_counter()
+        for i in range(total):
+            storage.store.get(i)
+        read_us = (time.perf_counter() - start) / total * 1e6
+
+        reloaded = Storage(ItemStore(), Item, mode, path)
+        await reloaded.start()
+        await reloaded.stop()
+        at_risk = {"memory": "todas", "sync": "0", "batched": f"até {storage.stats['max_pending']}"}[mode]
+        print(f"{mode:<8} {total / elapsed:8.0f} escritas/s  {storage.stats['commits']:5} commits  "
+              f"GET {read_us:.2f} us  após reiniciar {len(reloaded.store):6} itens  "
+              f"perdidas num crash: {at_risk}")
+        if os.path.exists(path):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    asyncio.run(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+                      int(sys.argv[2]) if len(sys.argv) > 2 else 50))
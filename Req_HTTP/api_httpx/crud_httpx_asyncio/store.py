@@ -0,0 +1,172 @@
+import re
+from bisect import bisect_right, insort
+
+# Palavras da descrição que entram no índice invertido
+TOKEN_RE = re.compile(r"\w+")
+
+# Folga sobre os passos esperados antes de uma varredura densa desistir
+SCAN_SLACK = 4
+
+
+def tokens(text: str):
+    return set(TOKEN_RE.findall(text.lower()))
+
+
+class _TrieNode:
+    __slots__ = ("ids", "children")
+
+    def __init__(self):
+        self.ids = set()  # Ids de todos os nomes que passam por este nó
+        self.children = {}
+
+
+class ItemStore:
+    """
+    Itens em memória por id, com índices secundários mantidos a cada escrita:
+
+        by_name      nome exato -> ids
+        trie         prefixo do nome (sem diferenciar maiúsculas) -> ids
+        by_token     palavra da descrição -> ids
+
+    Uma página de busca não ordena todos os resultados: com resultados
+    densos (prefixo curto) os ids são percorridos em ordem até encher a
+    página, e só quando há poucos candidatos eles são ordenados. Nos dois
+    casos o custo fica em torno de sqrt(limit * itens) e não cresce com o
+    número de resultados (a não ser quando filtros densos se cruzam em
+    poucos itens: aí a varredura desiste e os candidatos são ordenados).
+    """
+
+    def __init__(self):
+        self.items = {}
+        self.ids = []  # Ids em ordem crescente, para a paginação por cursor
+        self.by_name = {}
+        self.trie = _TrieNode()
+        self.by_token = {}
+        self.version = 0  # Muda a cada escrita; serve para invalidar respostas em cache
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item_id):
+        return item_id in self.items
+
+    def __getitem__(self, item_id):
+        return self.items[item_id]
+
+    def get(self, item_id, default=None):
+        return self.items.get(item_id, default)
+
+    def values(self):
+        return self.items.values()
+
+    def add(self, item):
+        self.version += 1
+        self.items[item.id] = item
+        insort(self.ids, item.id)
+        self._index(item.id, item)
+
+    # PUT: o item guardado em item_id passa a ser `item`
+    def replace(self, item_id, item):
+        self.version += 1
+        self._unindex(item_id, self.items[item_id])
+        self.items[item_id] = item
+        self._index(item_id, item)
+
+    def remove(self, item_id):
+        self.version += 1
+        self._unindex(item_id, self.items.pop(item_id))
+        self.ids.pop(bisect_right(self.ids, item_id) - 1)
+
+    def _index(self, item_id, item):
+        self.by_name.setdefault(item.name, set()).add(item_id)
+        node = self.trie
+        node.ids.add(item_id)
+        for char in item.name.lower():
+            node = node.children.setdefault(char, _TrieNode())
+            node.ids.add(item_id)
+        for token in tokens(item.description):
+            self.by_token.setdefault(token, set()).add(item_id)
+
+    def _unindex(self, item_id, item):
+        _discard(self.by_name, item.name, item_id)
+        # Desce guardando o caminho e sobe podando os nós que ficaram vazios
+        path = [self.trie]
+        for char in item.name.lower():
+            path.append(path[-1].children[char])
+        for node in path:
+            node.ids.discard(item_id)
+        for parent, char, node in reversed(list(zip(path, item.name.lower(), path[1:]))):
+            if node.ids:
+                break
+            del parent.children[char]
+        for token in tokens(item.description):
+            _discard(self.by_token, token, item_id)
+
+    def _prefix(self, prefix):
+        node = self.trie
+        for char in prefix.lower():
+            node = node.children.get(char)
+            if node is None:
+                return set()
+        return node.ids
+
+    # Uma página de ids que satisfazem todos os filtros, em ordem crescente, depois
+    # de `cursor`; retorna (ids, tem_mais). name termina com "*" para busca por
+    # prefixo; q casa todas as palavras na descrição
+    def page(self, cursor=None, limit=100, name=None, q=None):
+        start = 0 if cursor is None else bisect_right(self.ids, cursor)
+        sets = self._filters(name, q)
+        if sets is None:
+            ids = self.ids[start:start + limit + 1]
+        else:
+            ids = None
+            candidates = len(sets[0])
+            # Denso (prefixo curto): percorrer os ids em ordem enche a página em
+            # ~limit * n / candidatos passos, menos que ordenar os candidatos
+            if candidates * candidates > (limit + 1) * len(self.ids):
+                ids = self._scan(sets, start, limit + 1, SCAN_SLACK * (limit + 1) * len(self.ids) // candidates)
+            # Esparso, ou a intersecção com os outros filtros ficou esparsa
+            if ids is None:
+                matches = sets[0].intersection(*sets[1:])
+                ids = sorted(matches if cursor is None else [i for i in matches if i > cursor])[:limit + 1]
+        return ids[:limit], len(ids) > limit
+
+    # Conjuntos de ids de cada filtro, do menor para o maior, ou None sem filtros
+    def _filters(self, name, q):
+        sets = []
+        if name:
+            if name.endswith("*"):
+                sets.append(self._prefix(name[:-1]))
+            else:
+                sets.append(self.by_name.get(name, set()))
+        if q:
+            words = tokens(q)
+            sets.extend(self.by_token.get(word, set()) for word in words)
+            if not words:
+                sets.append(set())  # Só pontuação: nada casa
+        if not sets:
+            return None
+        sets.sort(key=len)
+        return sets
+
+    # Percorre os ids em ordem a partir de `start` até achar `count` que casam;
+    # None se passar de `budget` passos antes disso
+    def _scan(self, sets, start, count, budget):
+        ids = self.ids
+        end = min(start + budget, len(ids))
+        found = []
+        for i in range(start, end):
+            item_id = ids[i]
+            if all(item_id in ids_set for ids_set in sets):
+                found.append(item_id)
+                if len(found) == count:
+                    return found
+        return found if end == len(ids) else None
+
+
+def _discard(index, key, item_id):
+    ids = index.get(key)
+    if ids is not None:
+        ids.discard(item_id)
+        if not ids:
+            del index[key]
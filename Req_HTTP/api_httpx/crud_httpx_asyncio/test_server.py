@@ -0,0 +1,97 @@
+"""
+rode pytest test_server.py (no diretório crud_httpx_asyncio)
+
+Os endpoints rodam em processo (httpx.ASGITransport), com os itens só em memória.
+"""
+import asyncio
+import os
+
+import httpx
+import pytest
+
+os.environ.setdefault("ITEMS_STORAGE", "memory")
+import server  # noqa: E402
+from store import ItemStore  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def itens_vazios(monkeypatch):
+    monkeypatch.setattr(server, "items_db", ItemStore())
+    monkeypatch.setattr(server.storage, "store", server.items_db)
+    server.pages.entries.clear()  # As versões recomeçam do zero com o ItemStore novo
+
+
+def rodar(*requisicoes):
+    async def principal():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app), base_url="http://teste") as client:
+            return [await client.request(method, url, json=body) for method, url, body in requisicoes]
+    return asyncio.run(principal())
+
+
+def ids(response):
+    return [item["id"] for item in response.json()]
+
+
+def test_put_atualiza_os_indices():
+    respostas = rodar(
+        ("POST", "/items/", {"id": 1, "name": "alfa", "description": "azul verde"}),
+        ("POST", "/items/", {"id": 2, "name": "alfabeto", "description": "azul"}),
+        ("PUT", "/items/1", {"id": 1, "name": "beta", "description": "verde"}),
+        ("GET", "/items/?name=alfa", None),
+        ("GET", "/items/?name=alf*", None),
+        ("GET", "/items/?name=beta", None),
+        ("GET", "/items/?q=azul", None),
+        ("PUT", "/items/bulk", [{"id": 2, "name": "gama", "description": "verde"}]),
+        ("GET", "/items/?name=alf*", None),
+        ("GET", "/items/?q=verde", None),
+    )
+    assert [r.status_code for r in respostas[:3]] == [200, 200, 200]
+    assert ids(respostas[3]) == []
+    assert ids(respostas[4]) == [2]
+    assert ids(respostas[5]) == [1]
+    assert ids(respostas[6]) == [2]
+    assert respostas[7].json() == {"updated": 1}
+    assert ids(respostas[8]) == []
+    assert ids(respostas[9]) == [1, 2]
+
+
+def test_delete_tira_dos_indices():
+    respostas = rodar(
+        ("POST", "/items/bulk", [{"id": i, "name": f"item{i}", "description": "azul"} for i in range(1, 5)]),
+        ("DELETE", "/items/2", None),
+        ("DELETE", "/items/bulk", [3, 4]),
+        ("GET", "/items/?name=item*", None),
+        ("GET", "/items/?q=azul", None),
+        ("GET", "/items/?name=item3", None),
+        ("DELETE", "/items/2", None),
+    )
+    assert respostas[0].json() == {"created": 4}
+    assert respostas[2].json() == {"deleted": 2}
+    assert ids(respostas[3]) == ids(respostas[4]) == [1]
+    assert ids(respostas[5]) == []
+    assert respostas[6].status_code == 404
+
+
+def test_paginacao_por_cursor_com_filtro():
+    rodar(("POST", "/items/bulk", [{"id": i, "name": f"a{i}", "description": "x"} for i in range(1, 8)]))
+    cursor, vistos = None, []
+    while True:
+        url = "/items/?name=a*&limit=3" + (f"&cursor={cursor}" if cursor else "")
+        (resposta,) = rodar(("GET", url, None))
+        vistos += ids(resposta)
+        cursor = resposta.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert vistos == list(range(1, 8))
+
+
+def test_put_devolve_o_item_com_o_id_da_url():
+    respostas = rodar(
+        ("POST", "/items/", {"id": 4, "name": "alfa"}),
+        ("PUT", "/items/4", {"id": 999, "name": "beta", "description": "x"}),
+        ("GET", "/items/4", None),
+        ("GET", "/items/999", None),
+    )
+    assert respostas[1].json() == {"id": 4, "name": "beta", "description": "x"}
+    assert respostas[2].json() == respostas[1].json()
+    assert respostas[3].status_code == 404
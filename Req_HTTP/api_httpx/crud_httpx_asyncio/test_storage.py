@@ -0,0 +1,88 @@
+"""
+rode pytest test_storage.py (no diretório crud_httpx_asyncio)
+"""
+import asyncio
+import os
+import sqlite3
+
+import httpx
+
+os.environ.setdefault("ITEMS_STORAGE", "memory")
+import server  # noqa: E402
+import storage as storage_module  # noqa: E402
+from server import Item  # noqa: E402
+from storage import SQLiteBackend, Storage  # noqa: E402
+from store import ItemStore  # noqa: E402
+
+
+def _ler(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {row[0]: row[1:] for row in conn.execute("SELECT id, name, description FROM items")}
+    finally:
+        conn.close()
+
+
+# Backend cujas próximas `falhas` gravações levantam erro antes de chegar no banco
+class BackendInstavel(SQLiteBackend):
+    def __init__(self, path, falhas):
+        super().__init__(path)
+        self.falhas = falhas
+        self.tentativas = 0
+
+    async def apply(self, ops):
+        self.tentativas += 1
+        if self.falhas:
+            self.falhas -= 1
+            raise sqlite3.OperationalError("database is locked")
+        await super().apply(ops)
+
+
+def test_batched_regrava_depois_de_dois_commits_falharem(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_module, "RETRY_DELAY_MAX", 0.05)
+    path = str(tmp_path / "items.db")
+
+    async def principal():
+        storage = Storage(ItemStore(), Item, "batched", path)
+        storage.backend = BackendInstavel(path, falhas=2)
+        await storage.start()
+        await storage.put([Item(id=i, name=f"item{i}", description="v1") for i in range(5)])
+        await asyncio.sleep(0.02)  # Primeiro commit falha com as 5 escritas
+        # Escrita nova para um id que ainda está na fila: a versão nova tem de ganhar
+        await storage.put([Item(id=1, name="item1", description="v2")])
+        await storage.delete([4])
+        for _ in range(100):
+            if storage.backend.tentativas >= 3 and not storage.pending:
+                break
+            await asyncio.sleep(0.02)
+        await storage.stop()
+        return storage.backend.tentativas
+
+    tentativas = asyncio.run(principal())
+    assert tentativas >= 3
+    assert _ler(path) == {0: ("item0", "v1"), 1: ("item1", "v2"), 2: ("item2", "v1"), 3: ("item3", "v1")}
+
+
+def test_post_concorrente_com_mesmo_id(tmp_path, monkeypatch):
+    # Modo sync: o commit tem await, então sem o write_lock as cinco requisições
+    # passariam pela checagem de id antes de qualquer uma gravar
+    items_db = ItemStore()
+    monkeypatch.setattr(server, "items_db", items_db)
+    monkeypatch.setattr(server, "storage", Storage(items_db, Item, "sync", str(tmp_path / "items.db")))
+    server.pages.entries.clear()
+
+    async def principal():
+        await server.storage.start()
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=server.app),
+                                         base_url="http://teste") as client:
+                return await asyncio.gather(*(
+                    client.post("/items/", json={"id": 7, "name": f"nome{i}", "description": "x"})
+                    for i in range(5)))
+        finally:
+            await server.storage.stop()
+
+    respostas = asyncio.run(principal())
+    assert sorted(r.status_code for r in respostas) == [200, 400, 400, 400, 400]
+    vencedor = next(r.json() for r in respostas if r.status_code == 200)
+    assert _ler(str(tmp_path / "items.db")) == {7: (vencedor["name"], "x")}
@@ -0,0 +1,117 @@
+"""
+rode pytest test_store.py (no diretório crud_httpx_asyncio)
+"""
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from store import ItemStore, tokens
+
+NOMES = ["alfa", "alfabeto", "Alfredo", "beta", "betina", "gama", "a", "ab", ""]
+PALAVRAS = ["word1", "word2", "word3", "azul", "verde", "Azul!"]
+
+
+def _item(item_id, rng):
+    return SimpleNamespace(id=item_id, name=rng.choice(NOMES),
+                           description=" ".join(rng.sample(PALAVRAS, rng.randint(0, 3))))
+
+
+# O que page() deveria devolver, filtrando todos os itens na força bruta
+def _esperado(items, cursor, limit, name, q):
+    ids = sorted(items)
+    if name:
+        if name.endswith("*"):
+            ids = [i for i in ids if items[i].name.lower().startswith(name[:-1].lower())]
+        else:
+            ids = [i for i in ids if items[i].name == name]
+    if q:
+        words = tokens(q)
+        ids = [i for i in ids if words and words <= tokens(items[i].description)]
+    if cursor is not None:
+        ids = [i for i in ids if i > cursor]
+    return ids[:limit], len(ids) > limit
+
+
+def _paginas(store, limit, name, q):
+    cursor, todos = None, []
+    while True:
+        page, more = store.page(cursor, limit, name=name, q=q)
+        todos += page
+        if not more:
+            return todos
+        cursor = page[-1]
+
+
+FILTROS = [(None, None), ("a*", None), ("alfa", None), ("ALF*", None), ("*", None), ("x*", None),
+           (None, "word1"), (None, "word1 azul"), (None, "!!"), ("be*", "verde"), ("gama", "word2 word3")]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_page_igual_forca_bruta(seed):
+    rng = random.Random(seed)
+    store = ItemStore()
+    items = {}
+    for _ in range(3000):
+        operacao = rng.random()
+        if operacao < 0.5 or not items:
+            item_id = rng.randrange(2000)
+            if item_id not in items:
+                items[item_id] = _item(item_id, rng)
+                store.add(items[item_id])
+        elif operacao < 0.8:
+            item_id = rng.choice(list(items))
+            items[item_id] = _item(item_id, rng)
+            store.replace(item_id, items[item_id])
+        else:
+            item_id = rng.choice(list(items))
+            del items[item_id]
+            store.remove(item_id)
+
+        if rng.random() < 0.05:
+            name, q = rng.choice(FILTROS)
+            cursor = rng.choice([None, rng.randrange(-5, 2100)])
+            limit = rng.choice([1, 3, 50])
+            assert store.page(cursor, limit, name=name, q=q) == _esperado(items, cursor, limit, name, q)
+
+    assert store.ids == sorted(items)
+    for name, q in FILTROS:
+        assert _paginas(store, 7, name, q) == _esperado(items, None, len(items) + 1, name, q)[0]
+
+
+def test_replace_tira_do_indice_antigo():
+    store = ItemStore()
+    store.add(SimpleNamespace(id=1, name="alfa", description="azul verde"))
+    store.add(SimpleNamespace(id=2, name="alfabeto", description="azul"))
+    store.replace(1, SimpleNamespace(id=1, name="beta", description="verde"))
+
+    assert store.page(name="alfa") == ([], False)
+    assert store.page(name="alf*") == ([2], False)
+    assert store.page(name="beta") == ([1], False)
+    assert store.page(q="azul") == ([2], False)
+    assert store.page(q="verde") == ([1], False)
+    assert store.ids == [1, 2]
+
+
+def test_remove_poda_a_trie_e_os_indices():
+    store = ItemStore()
+    store.add(SimpleNamespace(id=1, name="alfa", description="azul"))
+    store.add(SimpleNamespace(id=2, name="al", description="verde"))
+    store.remove(1)
+
+    assert store.page(name="alf*") == ([], False)
+    assert store.page(name="al*") == ([2], False)
+    assert "f" not in store.trie.children["a"].children["l"].children
+    assert "azul" not in store.by_token and "alfa" not in store.by_name
+    store.remove(2)
+    assert store.trie.children == {} and store.by_token == {} and store.ids == []
+
+
+def test_page_cursor_e_tem_mais():
+    store = ItemStore()
+    for item_id in range(10):
+        store.add(SimpleNamespace(id=item_id, name="a%d" % item_id, description="par" if item_id % 2 == 0 else ""))
+    assert store.page(None, 2, q="par") == ([0, 2], True)
+    assert store.page(2, 2, q="par") == ([4, 6], True)
+    assert store.page(6, 2, q="par") == ([8], False)
+    assert store.page(3, 4) == ([4, 5, 6, 7], True)
@@ -0,0 +1,89 @@
+"""
+Caminho rápido para respostas JSON nos servidores FastAPI.
+
+FastJSONResponse usa orjson se estiver instalado (pip install orjson) e cai
+para o json da stdlib, sem espaços, se não estiver:
+
+    app = FastAPI(default_response_class=FastJSONResponse)
+
+BodyCache guarda corpos já serializados por chave, junto com a versão dos
+dados de onde saíram e um ETag. Enquanto a versão não muda o corpo não é
+gerado de novo, e um cliente que manda If-None-Match com o ETag recebe 304
+sem corpo nenhum:
+
+    bodies = BodyCache()
+
+    @app.get("/items/")
+    async def read_items(request: Request):
+        return bodies.response(request, "all", items_version, lambda: (dumps(items), {}))
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+MAX_CACHED_BODIES = 256
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def etag_for(body: bytes) -> str:
+    return '"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+# If-None-Match pode trazer vários ETags separados por vírgula, ou "*"
+def etag_matches(request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def not_modified(etag: str, headers=None) -> Response:
+    return Response(status_code=304, headers={**(headers or {}), "ETag": etag})
+
+
+class BodyCache:
+    def __init__(self, max_entries=MAX_CACHED_BODIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # chave -> (versão, corpo, etag, headers)
+        self.stats = {"hit": 0, "miss": 0, "not_modified": 0}
+
+    # build() -> (corpo em bytes, headers extras); só é chamado se a versão mudou
+    def get(self, key, version, build):
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.stats["hit"] += 1
+            self.entries.move_to_end(key)
+            return entry[1:]
+        self.stats["miss"] += 1
+        body, headers = build()
+        entry = (version, body, etag_for(body), headers)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return entry[1:]
+
+    def response(self, request, key, version, build, media_type="application/json"):
+        body, etag, headers = self.get(key, version, build)
+        if etag_matches(request, etag):
+            self.stats["not_modified"] += 1
+            return not_modified(etag, headers)
+        return Response(body, media_type=media_type, headers={**headers, "ETag": etag})
@@ -1,7 +1,10 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from pydantic import BaseModel
 
-app = FastAPI()
+from fast_json import BodyCache, FastJSONResponse, dumps
+
+app = FastAPI(default_response_class=FastJSONResponse)
+bodies = BodyCache()
 
 
 class Item(BaseModel):
@@ -9,9 +12,10 @@ class Item(BaseModel):
     description: str
 
 
+# Resposta fixa: serializada uma vez só (versão 0 para sempre), com ETag
 @app.get("/data")
-async def get_data():
-    return {"message": "Hello, world!"}
+async def get_data(request: Request):
+    return bodies.response(request, "data", 0, lambda: (dumps({"message": "Hello, world!"}), {}))
 
 
 @app.post("/data")
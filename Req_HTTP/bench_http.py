@@ -0,0 +1,271 @@
+"""
+Benchmark dos servidores FastAPI (api_httpx, crud_httpx_asyncio e teste_fapi).
+
+Cada endpoint é medido de dois jeitos:
+    inprocess   httpx.ASGITransport, sem rede nem uvicorn (só o custo do handler + framework)
+    uvicorn     servidor real em 127.0.0.1 com --workers N
+
+e o resultado é requisições por segundo e latência p50/p90/p99.
+
+    python bench_http.py                              # os dois modos
+    python bench_http.py --mode inprocess -n 2000
+    python bench_http.py --save base.json             # guarda os números
+    python bench_http.py --compare base.json          # compara e sai com 1 se piorou além de --tolerance
+"""
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(ROOT, "api_httpx")
+CRUD_DIR = os.path.join(API_DIR, "crud_httpx_asyncio")
+FAPI_DIR = os.path.join(os.path.dirname(ROOT), "bhp", "client-server", "teste_fastAPI", "teste_fapi")
+
+SEED_ITEMS = 10000  # Itens no servidor CRUD antes de medir
+BASE_PORT = 8100
+
+# Os apps: nome -> (diretório, módulo)
+APPS = {
+    "api_httpx": (API_DIR, "server_httpx"),
+    "crud": (CRUD_DIR, "server"),
+    "teste_fapi": (FAPI_DIR, "main"),
+}
+# Apps que guardam o estado no processo (o CRUD carrega os itens na memória):
+# com vários workers cada um teria a sua cópia, então sobem sempre com um só
+SINGLE_PROCESS_APPS = ("crud",)
+
+_new_ids = itertools.count(10_000_000)
+
+
+def _item(item_id):
+    return {"id": item_id, "name": f"item{item_id}", "description": f"word{item_id % 100} bench item"}
+
+
+# Endpoints: (app, nome, método, url, corpo); corpo pode ser uma função para gerar um novo a cada requisição
+ENDPOINTS = [
+    ("api_httpx", "GET /data", "GET", "/data", None),
+    ("api_httpx", "POST /data", "POST", "/data", {"name": "bench", "description": "item"}),
+    ("crud", "GET /items/ (100)", "GET", "/items/?limit=100", None),
+    ("crud", "GET /items/ 304", "GET", "/items/?limit=100", "etag"),
+    ("crud", "GET /items/ (1000, stream)", "GET", "/items/?limit=1000", None),
+    ("crud", "GET /items/{id}", "GET", "/items/1234", None),
+    ("crud", "GET /items/?name=item12*", "GET", "/items/?name=item12*", None),
+    ("crud", "GET /items/?q=word7", "GET", "/items/?q=word7&limit=50", None),
+    ("crud", "POST /items/", "POST", "/items/", lambda: _item(next(_new_ids))),
+    ("teste_fapi", "GET /ping", "GET", "/ping", None),
+    ("teste_fapi", "GET /status", "GET", "/status", None),
+    ("teste_fapi", "POST /data", "POST", "/data", {"name": "bench", "description": "item"}),
+]
+
+
+def load_app(directory, module_name):
+    # Cada app importa módulos vizinhos (store, storage, fast_json) pelo próprio diretório
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    spec = importlib.util.spec_from_file_location(f"bench_{module_name}_{len(sys.modules)}",
+                                                  os.path.join(directory, module_name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.app, module
+
+
+def percentile(samples, fraction):
+    return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+async def measure(client, method, url, body, requests, concurrency):
+    headers = {}
+    if body == "etag":
+        headers["If-None-Match"] = (await client.get(url)).headers["etag"]
+        body = None
+    latencies = []
+    errors = 0
+    remaining = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for _ in remaining:
+            payload = body() if callable(body) else body
+            start = time.perf_counter()
+            response = await client.request(method, url, json=payload, headers=headers)
+            await response.aread()
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p90": percentile(latencies, 0.90) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+        "errors": errors,
+    }
+
+
+# modes: app -> rótulo do modo nos resultados ("inprocess", "uvicorn x2"...)
+async def run_endpoints(clients, requests, concurrency, modes, results):
+    for app_name, name, method, url, body in ENDPOINTS:
+        client = clients[app_name]
+        await measure(client, method, url, body, min(requests // 10, 100), concurrency)  # aquecimento
+        result = await measure(client, method, url, body, requests, concurrency)
+        results[f"{modes[app_name]} | {app_name} | {name}"] = result
+        print_result(f"{modes[app_name]} | {app_name} | {name}", result)
+
+
+async def bench_inprocess(requests, concurrency, results):
+    clients = {}
+    for app_name, (directory, module_name) in APPS.items():
+        app, module = load_app(directory, module_name)
+        if app_name == "crud":
+            await module.storage.put([module.Item(**_item(i)) for i in range(SEED_ITEMS)])
+        clients[app_name] = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    try:
+        await run_endpoints(clients, requests, concurrency, dict.fromkeys(APPS, "inprocess"), results)
+    finally:
+        for client in clients.values():
+            await client.aclose()
+
+
+def seed_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS items (id INTEGER PRIMARY KEY, name TEXT NOT NULL, description TEXT NOT NULL)")
+    conn.executemany("INSERT INTO items VALUES (:id, :name, :description)", [_item(i) for i in range(SEED_ITEMS)])
+    conn.commit()
+    conn.close()
+
+
+def wait_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"uvicorn did not start on port {port}")
+
+
+# O que o "uvicorn --workers N" faz, mas com o socket criado com IPPROTO_TCP: o uvicorn
+# cria com proto 0, o asyncio só liga TCP_NODELAY quando o proto é TCP, e com Nagle +
+# ACK atrasado toda resposta (headers e corpo em dois writes) leva ~40 ms
+def serve(app_name, port, workers):
+    import uvicorn
+    from uvicorn.supervisors import Multiprocess
+
+    directory, module_name = APPS[app_name]
+    sys.path.insert(0, directory)
+    config = uvicorn.Config(f"{module_name}:app", port=port, workers=workers, log_level="warning", access_log=False)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", port))
+    sock.set_inheritable(True)
+    Multiprocess(config, sockets=[sock]).run()
+
+
+async def bench_uvicorn(requests, concurrency, workers, results):
+    directory = tempfile.mkdtemp()
+    database = os.path.join(directory, "items.db")
+    seed_database(database)
+    # Todos os workers carregam os mesmos itens do SQLite ao subir
+    env = dict(os.environ, ITEMS_STORAGE="batched", ITEMS_DB=database)
+    processes = []
+    clients = {}
+    modes = {}
+    try:
+        for port, app_name in enumerate(APPS, BASE_PORT):
+            app_workers = 1 if app_name in SINGLE_PROCESS_APPS else workers
+            modes[app_name] = f"uvicorn x{app_workers}"
+            processes.append(subprocess.Popen(
+                [sys.executable, __file__, "--serve", app_name, "--port", str(port), "--workers", str(app_workers)],
+                env=env))
+            clients[app_name] = httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{port}",
+                limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency))
+        for port in range(BASE_PORT, BASE_PORT + len(APPS)):
+            wait_port(port)
+        await run_endpoints(clients, requests, concurrency, modes, results)
+    finally:
+        for client in clients.values():
+            await client.aclose()
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+def print_result(name, result):
+    print(f"{name:<60} {result['rps']:9.0f} req/s   p50 {result['p50']:7.3f}   p90 {result['p90']:7.3f}   "
+          f"p99 {result['p99']:7.3f} ms" + (f"   {result['errors']} erros" if result["errors"] else ""))
+
+
+# Compara com um resultado salvo: pior se req/s caiu ou p99 subiu mais que a tolerância
+def compare(results, baseline, tolerance):
+    regressions = 0
+    print(f"\ncomparado com a base (tolerância {tolerance:.0%}):")
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        rps_change = result["rps"] / old["rps"] - 1
+        p99_change = result["p99"] / old["p99"] - 1
+        worse = rps_change < -tolerance or p99_change > tolerance
+        regressions += worse
+        print(f"{name:<60} req/s {rps_change:+7.1%}   p99 {p99_change:+7.1%}" + ("   PIOROU" if worse else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn", "both"), default="both")
+    parser.add_argument("-n", "--requests", type=int, default=1000, help="requisições por endpoint")
+    parser.add_argument("-c", "--concurrency", type=int, default=10)
+    parser.add_argument("-w", "--workers", type=int, default=2,
+                        help="workers do uvicorn (os apps de SINGLE_PROCESS_APPS sobem com um)")
+    parser.add_argument("--save", help="grava os resultados em JSON")
+    parser.add_argument("--compare", help="JSON salvo antes com --save")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--serve", choices=APPS, help="só sobe o app com uvicorn (usado pelo modo uvicorn)")
+    parser.add_argument("--port", type=int, default=BASE_PORT)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.workers)
+        return
+
+    # Em processo não há lifespan: o CRUD fica só em memória
+    os.environ.setdefault("ITEMS_STORAGE", "memory")
+    results = {}
+    if args.mode in ("inprocess", "both"):
+        asyncio.run(bench_inprocess(args.requests, args.concurrency, results))
+    if args.mode in ("uvicorn", "both"):
+        asyncio.run(bench_uvicorn(args.requests, args.concurrency, args.workers, results))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
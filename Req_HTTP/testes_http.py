@@ -17,24 +17,111 @@ mock/request mod
 
 rode pytest testes_http.py
 (rodamos testes 
+
+benchmark do cache (respx, sem rede): python testes_http.py bench
 """
 
+import asyncio
+import importlib.util
+import random
+import ssl
+import sys
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from typing import Literal, TypeAlias, get_args
+
+import certifi
 import httpx
+import pytest
 import respx
 
 url_cotacao = "https://economia.awesomeapi.com.br/json/last/{}"
 
 Moeda: TypeAlias = Literal['EUR', 'USD', 'BTC']
 
+# um client só para o módulo: DNS, TCP e TLS são pagos uma vez e a conexão é
+# reaproveitada. HTTP/2 só se o pacote h2 estiver instalado (pip install httpx[http2])
+HTTP2 = importlib.util.find_spec('h2') is not None
+# carregar os certificados leva dezenas de ms: um contexto TLS para todos os clients
+ssl_context = ssl.create_default_context(cafile=certifi.where())
+client = httpx.Client(
+    http2=HTTP2,
+    verify=ssl_context,
+    timeout=10,
+    limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60),
+)
+
+# cache por par de moedas:
+#   idade < CACHE_TTL                 -> devolve do cache
+#   idade < CACHE_TTL + CACHE_STALE   -> devolve do cache e atualiza em segundo plano
+#   mais velho que isso               -> busca na hora
+CACHE_TTL = 30
+CACHE_STALE = 300
+
+relogio = time.monotonic  # trocado nos testes
+_cache = {}  # 'USD-BRL' -> (dados, quando)
+_cache_lock = threading.Lock()
+_revalidando = {}  # 'USD-BRL' -> Future da atualização em andamento
+_revalidador = ThreadPoolExecutor(max_workers=4)
+cache_stats = {'hit': 0, 'stale': 0, 'miss': 0}
+
+
+def _guardar(code, data):
+    with _cache_lock:
+        _cache[code] = (data, relogio())
+
+
+def _buscar(code):
+    response = client.get(url_cotacao.format(code))
+    data = response.json()[code.replace('-', '')]
+    _guardar(code, data)
+    return data
+
+
+def _revalidar(code):
+    try:
+        _buscar(code)
+    except (KeyError, httpx.HTTPError):
+        pass  # fica com o valor antigo até a próxima tentativa
+    finally:
+        with _cache_lock:
+            _revalidando.pop(code, None)
+
+
+# dados do cache ou None se precisa buscar
+def _ler_cache(code):
+    with _cache_lock:
+        item = _cache.get(code)
+        if item is not None:
+            data, quando = item
+            idade = relogio() - quando
+            if idade < CACHE_TTL:
+                cache_stats['hit'] += 1
+                return data
+            if idade < CACHE_TTL + CACHE_STALE:
+                cache_stats['stale'] += 1
+                if code not in _revalidando:
+                    _revalidando[code] = _revalidador.submit(_revalidar, code)
+                return data
+        cache_stats['miss'] += 1
+    return None
+
+
+def limpar_cache():
+    with _cache_lock:
+        _cache.clear()
+        for chave in cache_stats:
+            cache_stats[chave] = 0
+
 
 def cotacao(moeda: Moeda):
     code = f'{moeda}-BRL'
     try:
-        response = httpx.get(
-            url_cotacao.format(code), timeout=10
-        )
-        data = response.json()[code.replace('-', '')]
+        data = _ler_cache(code)
+        if data is None:
+            data = _buscar(code)
         return f'ultima cotacao: {data["high"]}'
     except KeyError:
         return f'Codigo de moeda invalido. Use {get_args(Moeda)}'
@@ -48,6 +135,127 @@ def cotacao(moeda: Moeda):
         return ' Erro de Status'
 
 
+# a API aceita vários pares numa requisição só: /json/last/USD-BRL,EUR-BRL,BTC-BRL
+MAX_PARES_POR_REQUISICAO = 10
+
+# um AsyncClient e as buscas em andamento por event loop (asyncio.run cria um novo a cada chamada)
+_por_loop = weakref.WeakKeyDictionary()
+
+
+def _estado_do_loop():
+    loop = asyncio.get_running_loop()
+    if loop not in _por_loop:
+        _por_loop[loop] = {
+            'client': httpx.AsyncClient(
+                http2=HTTP2, verify=ssl_context, timeout=10,
+                limits=httpx.Limits(max_keepalive_connections=10, keepalive_expiry=60),
+            ),
+            'em_voo': {},  # 'USD-BRL' -> Future com os dados ou a exceção
+        }
+    return _por_loop[loop]
+
+
+# fecha o AsyncClient do loop atual; chame antes do loop acabar para não deixar conexões abertas
+async def fechar_client():
+    estado = _por_loop.pop(asyncio.get_running_loop(), None)
+    if estado is not None:
+        await estado['client'].aclose()
+
+
+# asyncio.run que fecha o AsyncClient do loop no fim
+def rodar(coro):
+    async def principal():
+        try:
+            return await coro
+        finally:
+            await fechar_client()
+    return asyncio.run(principal())
+
+
+# retorna {code: dados ou exceção}; se um par inválido derrubar o lote (404), tenta um a um
+async def _buscar_lote(async_client, lote):
+    try:
+        response = await async_client.get(url_cotacao.format(','.join(lote)))
+        if response.status_code == 404 and len(lote) > 1:
+            partes = await asyncio.gather(*(_buscar_lote(async_client, [code]) for code in lote))
+            return {code: data for parte in partes for code, data in parte.items()}
+        corpo = response.json()
+    except (httpx.HTTPError, httpx.InvalidURL, ValueError) as e:
+        return {code: e for code in lote}
+
+    resultado = {}
+    for code in lote:
+        try:
+            resultado[code] = corpo[code.replace('-', '')]
+            _guardar(code, resultado[code])
+        except (KeyError, TypeError):
+            resultado[code] = KeyError(code)
+    return resultado
+
+
+async def _resolver_lote(async_client, lote, futures):
+    resultado = await _buscar_lote(async_client, lote)
+    for code in lote:
+        futures[code].set_result(resultado[code])
+
+
+def _mensagem(data):
+    if isinstance(data, (KeyError, httpx.InvalidURL)):
+        return f'Codigo de moeda invalido. Use {get_args(Moeda)}'
+    if isinstance(data, (httpx.ConnectError, httpx.TimeoutException)):
+        return 'Erro de conexao. Tente novamente mais tarde.'
+    if isinstance(data, Exception):
+        return ' Erro de Status'
+    return f'ultima cotacao: {data["high"]}'
+
+
+async def cotacoes(moedas):
+    """
+    Cotação de várias moedas numa ida só: {'USD': 'ultima cotacao: ...', ...}
+
+    Pares no cache não vão para a rede; os outros vão juntos numa requisição
+    (em lotes concorrentes se passarem de MAX_PARES_POR_REQUISICAO) e um par
+    que já está sendo buscado por outra chamada não é pedido de novo.
+
+        rodar(cotacoes(['USD', 'EUR', 'BTC']))
+
+    Dentro de um event loop próprio, chame fechar_client() antes de ele terminar.
+    """
+    estado = _estado_do_loop()
+    em_voo = estado['em_voo']
+    codes = {moeda: f'{moeda}-BRL' for moeda in moedas}
+    resultados = {}
+    esperando = {}  # futures desta chamada, novos ou de outra chamada em andamento
+    novos = []
+    for code in dict.fromkeys(codes.values()):
+        data = _ler_cache(code)
+        if data is not None:
+            resultados[code] = data
+            continue
+        if code not in em_voo:
+            em_voo[code] = asyncio.get_running_loop().create_future()
+            novos.append(code)
+        esperando[code] = em_voo[code]
+
+    lotes = [novos[i:i + MAX_PARES_POR_REQUISICAO] for i in range(0, len(novos), MAX_PARES_POR_REQUISICAO)]
+    tarefas = [asyncio.create_task(_resolver_lote(estado['client'], lote, em_voo)) for lote in lotes]
+    try:
+        for code, future in esperando.items():
+            resultados[code] = await asyncio.shield(future)
+    finally:
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        for code in novos:
+            em_voo.pop(code, None)
+    return {moeda: _mensagem(resultados[code]) for moeda, code in codes.items()}
+
+
+@pytest.fixture(autouse=True)
+def cache_vazio():
+    limpar_cache()
+    yield
+    limpar_cache()
+
+
 @respx.mock
 def test_dolar():
     mocked_response = httpx.Response(
@@ -107,5 +315,165 @@ def test_erro_timeout():
     # ass (lol)
     assert result == 'Erro de conexao. Tente novamente mais tarde.'
 
+
+@respx.mock
+def test_cache_evita_nova_requisicao():
+    rota = respx.get(url_cotacao.format('USD-BRL')).mock(
+        httpx.Response(200, json={'USDBRL': {'high': 5.7939}})
+    )
+    assert cotacao('USD') == cotacao('USD') == "ultima cotacao: 5.7939"
+    assert rota.call_count == 1
+    assert cache_stats == {'hit': 1, 'stale': 0, 'miss': 1}
+
+
+@respx.mock
+def test_cache_stale_while_revalidate(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(sys.modules[__name__], 'relogio', lambda: agora[0])
+    rota = respx.get(url_cotacao.format('USD-BRL')).mock(side_effect=[
+        httpx.Response(200, json={'USDBRL': {'high': 5.0}}),
+        httpx.Response(200, json={'USDBRL': {'high': 6.0}}),
+    ])
+    assert cotacao('USD') == "ultima cotacao: 5.0"
+
+    # vencido, mas dentro da janela stale: responde o antigo e atualiza por trás
+    agora[0] += CACHE_TTL + 1
+    assert cotacao('USD') == "ultima cotacao: 5.0"
+    _revalidando['USD-BRL'].result()
+    assert cotacao('USD') == "ultima cotacao: 6.0"
+    assert rota.call_count == 2
+
+
+@respx.mock
+def test_cache_expirado_busca_na_hora(monkeypatch):
+    agora = [1000.0]
+    monkeypatch.setattr(sys.modules[__name__], 'relogio', lambda: agora[0])
+    respx.get(url_cotacao.format('USD-BRL')).mock(side_effect=[
+        httpx.Response(200, json={'USDBRL': {'high': 5.0}}),
+        httpx.ConnectError,
+    ])
+    cotacao('USD')
+    agora[0] += CACHE_TTL + CACHE_STALE + 1
+    assert cotacao('USD') == 'Erro de conexao. Tente novamente mais tarde.'
+
+
+@respx.mock
+def test_cotacoes_uma_requisicao():
+    rota = respx.get(url_cotacao.format('USD-BRL,EUR-BRL,BTC-BRL')).mock(
+        httpx.Response(200, json={'USDBRL': {'high': 5.1}, 'EURBRL': {'high': 6.2}, 'BTCBRL': {'high': 300000}})
+    )
+    resultado = rodar(cotacoes(['USD', 'EUR', 'BTC']))
+    assert resultado == {
+        'USD': 'ultima cotacao: 5.1', 'EUR': 'ultima cotacao: 6.2', 'BTC': 'ultima cotacao: 300000'
+    }
+    assert rota.call_count == 1
+
+    # agora tudo vem do cache
+    rodar(cotacoes(['USD', 'EUR', 'BTC']))
+    assert rota.call_count == 1
+
+
+@respx.mock
+def test_cotacoes_divide_em_lotes(monkeypatch):
+    monkeypatch.setattr(sys.modules[__name__], 'MAX_PARES_POR_REQUISICAO', 2)
+    lote1 = respx.get(url_cotacao.format('USD-BRL,EUR-BRL')).mock(
+        httpx.Response(200, json={'USDBRL': {'high': 5.1}, 'EURBRL': {'high': 6.2}})
+    )
+    lote2 = respx.get(url_cotacao.format('BTC-BRL')).mock(
+        httpx.Response(200, json={'BTCBRL': {'high': 300000}})
+    )
+    resultado = rodar(cotacoes(['USD', 'EUR', 'BTC']))
+    assert resultado['BTC'] == 'ultima cotacao: 300000'
+    assert lote1.call_count == lote2.call_count == 1
+
+
+@respx.mock
+def test_cotacoes_sem_duplicar_em_andamento():
+    usd = respx.get(url_cotacao.format('USD-BRL')).mock(
+        httpx.Response(200, json={'USDBRL': {'high': 5.1}})
+    )
+    eur = respx.get(url_cotacao.format('EUR-BRL')).mock(
+        httpx.Response(200, json={'EURBRL': {'high': 6.2}})
+    )
+
+    async def dois_paineis():
+        return await asyncio.gather(cotacoes(['USD']), cotacoes(['USD', 'EUR']))
+
+    primeiro, segundo = rodar(dois_paineis())
+    assert primeiro['USD'] == segundo['USD'] == 'ultima cotacao: 5.1'
+    assert usd.call_count == eur.call_count == 1
+
+
+@respx.mock
+def test_cotacoes_moeda_invalida_no_lote():
+    respx.get(url_cotacao.format('USD-BRL,MDT-BRL')).mock(httpx.Response(404, json={'code': 'CoinNotExists'}))
+    respx.get(url_cotacao.format('USD-BRL')).mock(httpx.Response(200, json={'USDBRL': {'high': 5.1}}))
+    respx.get(url_cotacao.format('MDT-BRL')).mock(httpx.Response(404, json={'code': 'CoinNotExists'}))
+    resultado = rodar(cotacoes(['USD', 'MDT']))
+    assert resultado == {
+        'USD': 'ultima cotacao: 5.1', 'MDT': "Codigo de moeda invalido. Use ('EUR', 'USD', 'BTC')"
+    }
+
+
+@respx.mock
+def test_cotacoes_erro_conexao():
+    respx.get(url_cotacao.format('USD-BRL,EUR-BRL')).mock(side_effect=httpx.ConnectError)
+    resultado = rodar(cotacoes(['USD', 'EUR']))
+    assert set(resultado.values()) == {'Erro de conexao. Tente novamente mais tarde.'}
+
+
+# benchmark com respx simulando LATENCIA de rede por requisição
+LATENCIA = 0.02
+
+
+def bench(requisicoes=2000):
+    global CACHE_TTL, CACHE_STALE
+
+    def resposta_lenta(request):
+        time.sleep(LATENCIA)
+        codes = request.url.path.rsplit('/', 1)[1].split(',')
+        return httpx.Response(200, json={code.replace('-', ''): {'high': random.random()} for code in codes})
+
+    moedas = get_args(Moeda)
+    ttl, stale = CACHE_TTL, CACHE_STALE
+    with respx.mock:
+        respx.get(url__regex=r'.*/json/last/.*').mock(side_effect=resposta_lenta)
+        # sem cache cada cotação espera a rede, então roda menos vezes
+        for nome, CACHE_TTL, CACHE_STALE, vezes in (('sem cache', 0, 0, requisicoes // 20),
+                                                    ('com cache', ttl, stale, requisicoes)):
+            limpar_cache()
+            latencias = []
+            for _ in range(vezes):
+                inicio = time.perf_counter()
+                cotacao(random.choice(moedas))
+                latencias.append(time.perf_counter() - inicio)
+            latencias.sort()
+            print(f'{nome}: {vezes} cotacoes, hit ratio {cache_stats["hit"] / vezes:.1%}, '
+                  f'p50 {latencias[vezes // 2] * 1000:.3f} ms, '
+                  f'p99 {latencias[int(vezes * 0.99)] * 1000:.3f} ms')
+
+        # painel que atualiza todas as moedas de uma vez, sem cache
+        CACHE_TTL, CACHE_STALE = 0, 0
+        inicio = time.perf_counter()
+        for _ in range(20):
+            for moeda in moedas:
+                cotacao(moeda)
+        serial = (time.perf_counter() - inicio) / 20
+
+        async def painel():
+            inicio = time.perf_counter()
+            for _ in range(20):
+                await cotacoes(moedas)
+            return (time.perf_counter() - inicio) / 20
+
+        lote = rodar(painel())
+        print(f'painel com {len(moedas)} moedas: cotacao() uma a uma {serial * 1000:.1f} ms, '
+              f'cotacoes() {lote * 1000:.1f} ms')
+        CACHE_TTL, CACHE_STALE = ttl, stale
+
+
+if __name__ == '__main__' and sys.argv[1:] == ['bench']:
+    bench()
+
 # print(cotacao('USD'))
 # print(cotacao('EUR'))
@@ -1,31 +1,179 @@
+import os
+import signal
 import socket
+import sys
 import threading
+import time
+from multiprocessing import Process
+
+import metrics
+from idle_sessions import IdleSessions, set_keepalive
 
 bind_ip = '0.0.0.0'
 bind_port = 9999
 
-server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+# numero de processos no modo pre-fork (0 = modo antigo, um processo so)
+WORKERS = int(os.environ.get("TCP_SERVER_WORKERS", "0"))
+RESTART_DELAY = 0.5  # espera antes de subir de novo um worker que morreu
+# worker que morre antes de STABLE_AFTER segundos (porta ocupada, erro no boot)
+# espera o dobro a cada nova morte, ate MAX_RESTART_DELAY
+STABLE_AFTER = 5
+MAX_RESTART_DELAY = 30
+
+# timeouts e keepalive (segundos)
+IDLE_TIMEOUT = float(os.environ.get("TCP_SERVER_IDLE_TIMEOUT", "30"))
+IDLE_MARK = IDLE_TIMEOUT / 2  # a partir daqui a conexao conta como ociosa
+REAP_INTERVAL = 5
+
 
-server.bind((bind_ip, bind_port))
+def report(stats):
+    print("[*] Conexoes: ativas=%(active)d ociosas=%(idle)d reaped=%(reaped)d" % stats)
 
-server.listen(5)
 
-print("[*] Listening on %s:%d" % (bind_ip, bind_port))
+# socket -> ultima atividade; o recv ja estoura em IDLE_TIMEOUT, a varredura pega
+# quem ficou preso mais que o dobro disso (num send, por exemplo)
+sessions = IdleSessions(IDLE_TIMEOUT * 2, IDLE_MARK, REAP_INTERVAL, report)
+
+# endpoint de metricas (workers usam METRICS_PORT + 1 + id do worker)
+METRICS_PORT = int(os.environ.get("TCP_SERVER_METRICS_PORT", "9109"))
+CONNECTIONS = metrics.Counter("tcp_connections_total", "Conexoes aceitas")
+BYTES_IN = metrics.Counter("tcp_bytes_received_total", "Bytes recebidos dos clientes")
+BYTES_OUT = metrics.Counter("tcp_bytes_sent_total", "Bytes enviados aos clientes")
+LATENCY = metrics.Histogram("tcp_request_seconds", "Tempo de atendimento por comando", ("command",))
+metrics.Gauge("tcp_active_connections", "Conexoes abertas", function=lambda: len(sessions))
+metrics.Gauge("tcp_idle_connections", "Conexoes ociosas na ultima varredura",
+              function=lambda: sessions.stats["idle"])
+metrics.Gauge("tcp_reaped_connections", "Conexoes derrubadas por inatividade",
+              function=lambda: sessions.stats["reaped"])
+metrics.Gauge("tcp_threads", "Threads vivas no processo", function=threading.active_count)
 
 
 # fixme THIS IS OUR CLIENT-HANDLING THREAD
 
 def handle_client(client_socket):
-    # print out what the client sends
-    request = client_socket.recv(1024)
-    print("[*] Received %r" % request)
-    client_socket.send("ACK!")
-    client_socket.close()
-
-
-while True:
-    client,addr = server.accept()
-    print("[*] Accepted connection from: %s:%d" % (addr[0],addr[1]))
-    # spin up our client thread to handle incoming data
-    client_handler = threading.Thread(target=handle_client,args=(client,))
-    client_handler.start()
+    sessions.add(client_socket, client_socket)
+    client_socket.settimeout(IDLE_TIMEOUT)
+    try:
+        # print out what the client sends
+        request = client_socket.recv(1024)
+        start = time.perf_counter()
+        print("[*] Received %r" % request)
+        BYTES_IN.inc(amount=len(request))
+        BYTES_OUT.inc(amount=client_socket.send(b"ACK!"))
+        LATENCY.observe(time.perf_counter() - start, "ACK")
+        sessions.remove(client_socket)
+    except socket.timeout:
+        print("[!] Timeout de inatividade, fechando conexao.")
+        sessions.remove(client_socket, reaped=True)
+    except OSError:
+        sessions.remove(client_socket)
+    finally:
+        client_socket.close()
+
+
+def create_server(reuse_port=False):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        # cada worker faz bind na mesma porta e o kernel distribui os accepts
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server.bind((bind_ip, bind_port))
+    server.listen(128 if reuse_port else 5)
+    return server
+
+
+def accept_loop(server):
+    sessions.start()
+    while True:
+        client, addr = server.accept()
+        set_keepalive(client)
+        CONNECTIONS.inc()
+        print("[*] Accepted connection from: %s:%d" % (addr[0], addr[1]))
+        # spin up our client thread to handle incoming data
+        client_handler = threading.Thread(target=handle_client, args=(client,))
+        client_handler.start()
+
+
+def worker(worker_id):
+    # o fork herda o handler do supervisor; o terminate() dele deve matar o worker direto
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = create_server(reuse_port=True)
+    metrics.start_http_server(METRICS_PORT + 1 + worker_id)
+    print("[*] Worker %d (pid %d) listening on %s:%d" % (worker_id, os.getpid(), bind_ip, bind_port))
+    try:
+        accept_loop(server)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def spawn_worker(worker_id):
+    process = Process(target=worker, args=(worker_id,), daemon=True)
+    process.start()
+    process.started_at = time.monotonic()
+    return process
+
+
+def stop_supervisor(signum, frame):
+    raise SystemExit(0)
+
+
+# Supervisor: sobe N workers e reinicia os que morrerem
+def supervise(num_workers):
+    if not hasattr(socket, "SO_REUSEPORT"):
+        print("[!!] SO_REUSEPORT nao suportado nesta plataforma, usando um processo so.")
+        return serve_single()
+
+    # SIGTERM (kill, systemd, docker stop) passa pelo mesmo finally do Ctrl+C,
+    # senao os workers ficam orfaos atendendo na porta
+    signal.signal(signal.SIGTERM, stop_supervisor)
+    workers = {i: spawn_worker(i) for i in range(num_workers)}
+    delays = {i: RESTART_DELAY for i in range(num_workers)}
+    restart_at = {}  # worker_id -> quando subir de novo
+    print("[*] Supervisor (pid %d) com %d workers em %s:%d" % (os.getpid(), num_workers, bind_ip, bind_port))
+    try:
+        while True:
+            time.sleep(RESTART_DELAY)
+            now = time.monotonic()
+            for worker_id, process in list(workers.items()):
+                if worker_id in restart_at:
+                    if now >= restart_at[worker_id]:
+                        del restart_at[worker_id]
+                        workers[worker_id] = spawn_worker(worker_id)
+                    continue
+                if process.is_alive():
+                    continue
+                if now - process.started_at < STABLE_AFTER:
+                    delays[worker_id] = min(delays[worker_id] * 2, MAX_RESTART_DELAY)
+                else:
+                    delays[worker_id] = RESTART_DELAY
+                print("[!] Worker %d (pid %s) morreu com codigo %s, reiniciando em %.1fs..."
+                      % (worker_id, process.pid, process.exitcode, delays[worker_id]))
+                restart_at[worker_id] = now + delays[worker_id]
+    except KeyboardInterrupt:
+        print("\n[!] Encerrando workers.")
+    finally:
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join()
+
+
+def serve_single():
+    server = create_server()
+    print("[*] Listening on %s:%d" % (bind_ip, bind_port))
+    metrics.start_http_server(METRICS_PORT)
+    accept_loop(server)
+
+
+if __name__ == "__main__":
+    # uso: python TCP_SERVER_MULTI_THREADED.py [workers]
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else WORKERS
+    if num_workers == -1:
+        num_workers = os.cpu_count() or 1
+
+    if num_workers > 0:
+        supervise(num_workers)
+    else:
+        serve_single()
@@ -0,0 +1,110 @@
+"""
+Conexões TCP ociosas, compartilhado pelo TCP_SERVER_MULTI_THREADED.py e pelo
+serverTCP2/serverV1.2.py.
+
+set_keepalive() liga o keepalive do kernel, que derruba peers mortos (cabo
+puxado, máquina desligada). IdleSessions guarda o socket e a última atividade
+de cada conexão; uma thread varre de tempos em tempos, atualiza os contadores
+e derruba quem passou do timeout (o shutdown acorda a thread presa no recv):
+
+    clients = IdleSessions(timeout=300, mark=60, interval=10)
+    clients.start()
+
+    set_keepalive(conn)
+    clients.add(addr, conn)
+    clients.touch(addr)      # a cada comando
+    clients.remove(addr)     # ao desconectar
+"""
+import socket
+import threading
+import time
+
+KEEPALIVE_IDLE = 60
+KEEPALIVE_INTERVAL = 10
+KEEPALIVE_COUNT = 3
+
+
+# Ativa o keepalive do TCP para detectar peers mortos
+def set_keepalive(sock, idle=KEEPALIVE_IDLE, interval=KEEPALIVE_INTERVAL, count=KEEPALIVE_COUNT):
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # As opções TCP_KEEP* não existem em todas as plataformas
+    for option, value in (("TCP_KEEPIDLE", idle),
+                          ("TCP_KEEPINTVL", interval),
+                          ("TCP_KEEPCNT", count)):
+        if hasattr(socket, option):
+            sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+class IdleSessions:
+    """
+    chave -> socket, com a última atividade de cada um. timeout: sem atividade
+    por mais que isso a conexão é derrubada; mark: a partir daqui conta como
+    ociosa nos contadores. report(stats) é chamado a cada varredura com
+    conexões, para o servidor imprimir do seu jeito.
+    """
+
+    def __init__(self, timeout, mark, interval, report=None):
+        self.timeout = timeout
+        self.mark = mark
+        self.interval = interval
+        self.report = report
+        self.conns = {}
+        self.last_seen = {}  # chave -> time.monotonic()
+        self.lock = threading.Lock()
+        self.stats = {"active": 0, "idle": 0, "reaped": 0}
+
+    def __len__(self):
+        return len(self.conns)
+
+    def __contains__(self, key):
+        return key in self.conns
+
+    def __getitem__(self, key):
+        return self.conns[key]
+
+    def add(self, key, conn):
+        with self.lock:
+            self.conns[key] = conn
+            self.last_seen[key] = time.monotonic()
+
+    # Só se a sessão ainda existe: a varredura pode tê-la removido no meio do comando
+    def touch(self, key):
+        with self.lock:
+            if key in self.conns:
+                self.last_seen[key] = time.monotonic()
+
+    # Retorna False se a sessão já tinha sido removida (pela varredura, por exemplo)
+    def remove(self, key, reaped=False):
+        with self.lock:
+            conn = self.conns.pop(key, None)
+            self.last_seen.pop(key, None)
+            if conn is not None and reaped:
+                self.stats["reaped"] += 1
+        return conn is not None
+
+    def start(self):
+        threading.Thread(target=self._reaper, daemon=True).start()
+
+    def _reaper(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            stale = []
+            with self.lock:
+                idle = 0
+                for key, seen in self.last_seen.items():
+                    if now - seen > self.timeout:
+                        stale.append((key, self.conns[key]))
+                    elif now - seen > self.mark:
+                        idle += 1
+                self.stats["active"] = len(self.conns)
+                self.stats["idle"] = idle
+            for key, conn in stale:
+                # shutdown acorda a thread presa no recv/send
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                self.remove(key, reaped=True)
+            if (self.conns or stale) and self.report is not None:
+                self.report(self.stats)
@@ -0,0 +1,193 @@
+"""
+Métricas de runtime compartilhadas pelos servidores TCP/UDP.
+
+Contadores, gauges e histogramas em memória, expostos no formato texto
+do Prometheus em uma porta lateral:
+
+    import metrics
+    REQUESTS = metrics.Counter("requests_total", "Comandos recebidos", ("command",))
+    LATENCY = metrics.Histogram("request_seconds", "Latência por comando", ("command",))
+    metrics.start_http_server(9100)
+
+    REQUESTS.inc("LIST")
+    with LATENCY.time("LIST"):
+        ...
+
+No caminho da requisição só há um lock e uma soma; a renderização do texto
+acontece apenas quando o endpoint /metrics é consultado.
+"""
+import bisect
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import fcntl
+    import termios
+except ImportError:  # Windows
+    fcntl = termios = None
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY = []  # Todas as métricas criadas, na ordem de criação
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ""
+    body = ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                    for name, value in pairs)
+    return "{%s}" % body
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.documentation),
+                 "# TYPE %s %s" % (self.name, self.kind)]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    def _samples(self):
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return ["%s%s %s" % (self.name, _format_labels(self.labelnames, key), value)
+                for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = function  # Lido só na hora do scrape
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set_function(self, function):
+        self._function = function
+
+    def _samples(self):
+        if self._function is not None:
+            return ["%s %s" % (self.name, self._function())]
+        with self._lock:
+            items = list(self._values.items())
+        return ["%s%s %s" % (self.name, _format_labels(self.labelnames, key), value)
+                for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # labels -> [contagens por bucket..., +Inf, soma]
+
+    def observe(self, value, *labelvalues):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            if counts is None:
+                counts = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, *labelvalues):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labelvalues)
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(counts)) for key, counts in self._values.items()]
+        lines = []
+        for key, counts in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, (("le", bound),))
+                lines.append("%s_bucket%s %d" % (self.name, labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            lines.append("%s_sum%s %s" % (self.name, labels, counts[-1]))
+            lines.append("%s_count%s %d" % (self.name, labels, cumulative))
+        return lines
+
+
+# Bytes esperando leitura no socket (fila do kernel); -1 se não suportado
+def pending_bytes(sock):
+    if fcntl is None:
+        return -1
+    try:
+        buffer = fcntl.ioctl(sock.fileno(), termios.FIONREAD, struct.pack("i", 0))
+    except OSError:
+        return -1
+    return struct.unpack("i", buffer)[0]
+
+
+def render():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Não polui o log do servidor a cada scrape
+
+
+# Sobe o endpoint /metrics numa thread daemon e retorna o servidor HTTP
+def start_http_server(port, host="127.0.0.1"):
+    httpd = ThreadingHTTPServer((host, port), _MetricsHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    print(f"[*] Métricas em http://{host}:{port}/metrics")
+    return httpd
@@ -1,15 +1,56 @@
 import socket
 import threading
 import os
+import sys
+import time
 from datetime import datetime
 
+# metrics.py fica no diretório client-server, um nível acima
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics  # noqa: E402
+from idle_sessions import IdleSessions, set_keepalive  # noqa: E402
+
 # Configs do server
 HOST = '127.0.0.1'  # Endereço IP do servidor
 PORT = 12345  # Porta usada pelo servidor
 DIRECTORY = 'files'  # Diretório para armazenar os arquivos
-clients = {}  # Dicionário para armazenar os clientes conectados (nós)
 messages = []  # Lista para armazenar as mensagens enviadas
 
+# Timeouts de inatividade e keepalive (segundos)
+IDLE_TIMEOUT = 300  # Conexão sem nenhum comando nesse tempo é encerrada
+IDLE_MARK = 60  # A partir daqui a conexão conta como ociosa nos contadores
+REAP_INTERVAL = 10  # Intervalo de varredura do reaper
+
+
+
+# Impresso a cada varredura do reaper
+def report(stats):
+    print("Conexões: ativas={active} ociosas={idle} removidas={reaped}".format(**stats))
+
+
+# Clientes conectados (nós): addr -> socket, com a última atividade de cada um
+clients = IdleSessions(IDLE_TIMEOUT, IDLE_MARK, REAP_INTERVAL, report)
+
+# Métricas no formato Prometheus em uma porta lateral
+METRICS_PORT = 9112
+COMMANDS = metrics.Counter("node_commands_total", "Comandos recebidos", ("command",))
+LATENCY = metrics.Histogram("node_command_seconds", "Tempo de atendimento por comando", ("command",))
+BYTES_IN = metrics.Counter("node_bytes_received_total", "Bytes recebidos dos nós")
+BYTES_OUT = metrics.Counter("node_bytes_sent_total", "Bytes enviados aos nós")
+metrics.Gauge("node_active_connections", "Nós conectados", function=lambda: len(clients))
+metrics.Gauge("node_idle_connections", "Nós ociosos na última varredura", function=lambda: clients.stats["idle"])
+metrics.Gauge("node_reaped_connections", "Nós removidos por inatividade", function=lambda: clients.stats["reaped"])
+metrics.Gauge("node_stored_messages", "Mensagens armazenadas", function=lambda: len(messages))
+KNOWN_COMMANDS = ('UPLOAD', 'DOWNLOAD', 'LIST', 'MESSAGE', 'LIST MESSAGES')
+
+
+# Envia a resposta e contabiliza os bytes
+def reply(conn, text):
+    payload = text.encode()
+    conn.send(payload)
+    BYTES_OUT.inc(amount=len(payload))
+
+
 # Cria o diretório de arquivos se não existir
 if not os.path.exists(DIRECTORY):
     os.makedirs(DIRECTORY)
@@ -18,14 +59,20 @@ if not os.path.exists(DIRECTORY):
 # Função para lidar com cada cliente
 def handle_client(conn, addr):
     print(f'Cliente conectado: {addr}')
-    conn.send("Conectado ao servidor!\n".encode())
-    clients[addr] = conn  # Armazena o cliente conectado
+    set_keepalive(conn)
+    conn.settimeout(IDLE_TIMEOUT)
+    reply(conn, "Conectado ao servidor!\n")
+    clients.add(addr, conn)  # Armazena o cliente conectado
 
     while True:
         try:
-            data = conn.recv(1024).decode()
-            if not data:
+            raw = conn.recv(1024)
+            if not raw:
                 break
+            clients.touch(addr)
+            start = time.perf_counter()
+            BYTES_IN.inc(amount=len(raw))
+            data = raw.decode()
 
             command = data.split('|')[0].upper()
 
@@ -35,35 +82,35 @@ def handle_client(conn, addr):
                     file_content = data.split('|')[2]
                     with open(os.path.join(DIRECTORY, filename), 'w') as f:
                         f.write(file_content)
-                    conn.send(f"Arquivo {filename} enviado com sucesso!\n".encode())
+                    reply(conn, f"Arquivo {filename} enviado com sucesso!\n")
                 except IndexError:
-                    conn.send("Erro: Formato de comando UPLOAD incorreto.\n".encode())
+                    reply(conn, "Erro: Formato de comando UPLOAD incorreto.\n")
                 except Exception as e:
                     print(f"Erro no upload: {e}")
-                    conn.send(f"Erro ao enviar o arquivo {filename}.\n".encode())
+                    reply(conn, f"Erro ao enviar o arquivo {filename}.\n")
 
             elif command == 'DOWNLOAD':
                 try:
                     filename = data.split('|')[1]
                     with open(os.path.join(DIRECTORY, filename), 'r') as f:
                         file_content = f.read()
-                    conn.send(f"DOWNLOAD|{filename}|{file_content}\n".encode())
+                    reply(conn, f"DOWNLOAD|{filename}|{file_content}\n")
                 except IndexError:
-                    conn.send("Erro: Formato de comando DOWNLOAD incorreto.\n".encode())
+                    reply(conn, "Erro: Formato de comando DOWNLOAD incorreto.\n")
                 except FileNotFoundError:
-                    conn.send(f"Erro: Arquivo {filename} não encontrado.\n".encode())
+                    reply(conn, f"Erro: Arquivo {filename} não encontrado.\n")
                 except Exception as e:
                     print(f"Erro no download: {e}")
-                    conn.send(f"Erro ao baixar o arquivo {filename}.\n".encode())
+                    reply(conn, f"Erro ao baixar o arquivo {filename}.\n")
 
             elif command == 'LIST':
                 try:
                     files = os.listdir(DIRECTORY)
                     file_list = ', '.join(files) if files else "Nenhum arquivo disponível"
-                    conn.send(f"Arquivos disponíveis: {file_list}\n".encode())
+                    reply(conn, f"Arquivos disponíveis: {file_list}\n")
                 except Exception as e:
                     print(f"Erro ao listar arquivos: {e}")
-                    conn.send("Erro ao listar arquivos.\n".encode())
+                    reply(conn, "Erro ao listar arquivos.\n")
 
             elif command == 'MESSAGE':
                 try:
@@ -81,14 +128,14 @@ def handle_client(conn, addr):
                     if recipient_ip_port in clients:
                         msg_with_time = f"MESSAGE from {addr[0]} at {current_time}: {message}"
                         clients[recipient_ip_port].send(f"{msg_with_time}\n".encode())
-                        conn.send(f"Mensagem enviada para {recipient_ip_port}\n".encode())
+                        reply(conn, f"Mensagem enviada para {recipient_ip_port}\n")
 
                         # Armazena a mensagem
                         messages.append(f"From {addr[0]} to {recipient_ip_port[0]} at {current_time}: {message}")
                     else:
-                        conn.send(f"Erro: Nó {recipient_ip_port} não encontrado.\n".encode())
+                        reply(conn, f"Erro: Nó {recipient_ip_port} não encontrado.\n")
                 except IndexError:
-                    conn.send("Erro: Formato de comando MESSAGE incorreto.\n".encode())
+                    reply(conn, "Erro: Formato de comando MESSAGE incorreto.\n")
 
             elif command == 'LIST MESSAGES':
                 try:
@@ -97,20 +144,32 @@ def handle_client(conn, addr):
                         message_list = "\n".join(messages)
                     else:
                         message_list = "Nenhuma mensagem disponível."
-                    conn.send(f"Mensagens:\n{message_list}\n".encode())
+                    reply(conn, f"Mensagens:\n{message_list}\n")
                 except Exception as e:
-                    conn.send(f"Erro ao listar mensagens: {e}\n".encode())
+                    reply(conn, f"Erro ao listar mensagens: {e}\n")
 
             else:
-                conn.send("Comando inválido!\n".encode())
+                reply(conn, "Comando inválido!\n")
 
+            label = command if command in KNOWN_COMMANDS else 'INVALID'
+            COMMANDS.inc(label)
+            LATENCY.observe(time.perf_counter() - start, label)
+
+        except socket.timeout:
+            print(f'Timeout de inatividade: {addr}')
+            clients.remove(addr, reaped=True)
+            break
+        except OSError as e:
+            # Conexão derrubada (pelo peer ou pelo reaper)
+            print(f"Conexão perdida: {e}")
+            break
         except Exception as e:
             print(f"Erro na comunicação: {e}")
-            conn.send("Erro na operação!\n".encode())
+            reply(conn, "Erro na operação!\n")
             break
 
     conn.close()
-    del clients[addr]  # Remove o cliente da lista
+    clients.remove(addr)  # Remove o cliente da lista
     print(f'Cliente desconectado: {addr}')
 
 
@@ -120,6 +179,8 @@ def start_server():
     server.bind((HOST, PORT))
     server.listen(5)
     print(f'Servidor iniciado em {HOST}:{PORT}...')
+    clients.start()
+    metrics.start_http_server(METRICS_PORT)
 
     while True:
         conn, addr = server.accept()
@@ -0,0 +1,86 @@
+import socket
+import json
+import os
+import sys
+import time
+
+# udp_framing.py fica no diretório client-server, um nível acima
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from udp_framing import ReliableSocket  # noqa: E402
+
+# Cliente de carga para o serverUDP_V1.0: mede requisições por segundo
+# uso: python carga_UDP.py [requisicoes] [acao] [modo]
+#   acao: ver_tabelas | inserir
+#   modo: confiavel (ReliableSocket, com ACKs) | bruto (JSON cru em um datagrama, como os clientes antigos)
+
+HOST = "localhost"
+PORT = 12345
+TIMEOUT = 2
+
+
+# Socket comum com a mesma interface do ReliableSocket, sem framing nem ACKs
+class SocketBruto:
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def sendto(self, payload, addr):
+        return self.sock.sendto(payload, addr)
+
+    def recvfrom(self, timeout=None):
+        self.sock.settimeout(timeout)
+        try:
+            return self.sock.recvfrom(65535)
+        except socket.timeout:
+            return None
+
+    def close(self):
+        self.sock.close()
+
+
+def preparar(cliente):
+    comando = {
+        "acao": "criar_tabela",
+        "sql": "CREATE TABLE IF NOT EXISTS carga (id INTEGER PRIMARY KEY, valor TEXT)"
+    }
+    cliente.sendto(json.dumps(comando).encode(), (HOST, PORT))
+    cliente.recvfrom(timeout=TIMEOUT)
+
+
+def rodar(total, acao, modo):
+    if modo == "bruto":
+        cliente = SocketBruto()
+    else:
+        cliente = ReliableSocket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+    preparar(cliente)
+
+    if acao == "inserir":
+        comando = {"acao": "executar_sql", "sql": "INSERT INTO carga (valor) VALUES (?)", "parametros": ["x"]}
+    else:
+        comando = {"acao": "ver_tabelas"}
+    payload = json.dumps(comando).encode()
+
+    perdidos = 0
+    latencias = []
+    inicio = time.perf_counter()
+    for _ in range(total):
+        t0 = time.perf_counter()
+        cliente.sendto(payload, (HOST, PORT))
+        if cliente.recvfrom(timeout=TIMEOUT) is None:
+            perdidos += 1
+            continue
+        latencias.append(time.perf_counter() - t0)
+    duracao = time.perf_counter() - inicio
+    cliente.close()
+
+    latencias.sort()
+    p50 = latencias[len(latencias) // 2] * 1000 if latencias else 0
+    p99 = latencias[int(len(latencias) * 0.99)] * 1000 if latencias else 0
+    print(f"{acao} ({modo}): {total} requisições em {duracao:.2f}s -> {len(latencias) / duracao:.0f} req/s "
+          f"(p50 {p50:.2f} ms, p99 {p99:.2f} ms, perdidos {perdidos})")
+
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    acao = sys.argv[2] if len(sys.argv) > 2 else "ver_tabelas"
+    modo = sys.argv[3] if len(sys.argv) > 3 else "confiavel"
+    rodar(total, acao, modo)
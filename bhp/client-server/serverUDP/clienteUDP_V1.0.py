@@ -1,12 +1,33 @@
 import socket
 import json
+import os
+import sys
+import uuid
+
+# udp_framing.py fica no diretório client-server, um nível acima
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from udp_framing import ReliableSocket  # noqa: E402
+
+TIMEOUT = 30  # Tempo máximo esperando a resposta do servidor
+
 
 # Função para enviar comandos para o servidor
 def enviar_comando(comando):
-    cliente_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    cliente_socket = ReliableSocket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+    comando = dict(comando, id=uuid.uuid4().hex)  # Id para correlacionar a resposta
     cliente_socket.sendto(json.dumps(comando).encode(), ("localhost", 12345))
-    resposta, _ = cliente_socket.recvfrom(1024)
-    print("Resposta do servidor:", json.loads(resposta.decode()))
+    while True:
+        recebido = cliente_socket.recvfrom(timeout=TIMEOUT)
+        if recebido is None:
+            print("Sem resposta do servidor.")
+            break
+        resposta = json.loads(recebido[0].decode())
+        if resposta.get("id") != comando["id"]:
+            continue  # Resposta atrasada de outra requisição
+        print("Resposta do servidor:", resposta)
+        # Ações lentas são aceitas na hora; o resultado chega em outro datagrama
+        if resposta.get("status") != "aceito":
+            break
     cliente_socket.close()
 
 # Exemplo de uso das funções do cliente
@@ -31,6 +52,25 @@ comando = {
 }
 enviar_comando(comando)
 
+# Executar vários comandos em uma única transação
+comando = {
+    "acao": "executar_lote",
+    "comandos": [
+        "CREATE TABLE IF NOT EXISTS exemplo (id INTEGER PRIMARY KEY, nome TEXT, idade INTEGER)",
+        "INSERT INTO exemplo (nome, idade) VALUES ('Ana', 30)",
+        "INSERT INTO exemplo (nome, idade) VALUES ('Bruno', 25)"
+    ]
+}
+enviar_comando(comando)
+
+# Inserir várias linhas com um statement preparado
+comando = {
+    "acao": "executar_sql",
+    "sql": "INSERT INTO exemplo (nome, idade) VALUES (?, ?)",
+    "lote": [["Carla", 41], ["Diego", 19]]
+}
+enviar_comando(comando)
+
 # Ver tabelas
 comando = {
     "acao": "ver_tabelas"
@@ -1,84 +1,226 @@
 import sqlite3
 import socket
 import json
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
-
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+
+# metrics.py fica no diretório client-server, um nível acima
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics  # noqa: E402
+import table_export  # noqa: E402
+from udp_framing import ReliableSocket, TransferError  # noqa: E402
+
+# Métricas no formato Prometheus em uma porta lateral
+METRICS_PORT = 9113
+COMANDOS = metrics.Counter("udp_commands_total", "Comandos recebidos", ("acao",))
+LATENCIA = metrics.Histogram("udp_command_seconds", "Tempo de execução por comando", ("acao",))
+BYTES_IN = metrics.Counter("udp_bytes_received_total", "Bytes recebidos")
+BYTES_OUT = metrics.Counter("udp_bytes_sent_total", "Bytes enviados")
+# Contados no despachar/ao_concluir, sem ler o estado interno dos executors
+SQL_PENDENTES = metrics.Gauge("udp_sql_pending", "Comandos aguardando ou rodando numa thread do SQLite")
+PDF_PENDENTES = metrics.Gauge("udp_pdf_pending", "PDFs aguardando ou em renderização")
+SQL_PENDENTES.set(0)
+PDF_PENDENTES.set(0)
+
+# Configuração do banco
+DB_PATH = "servidor.db"
+POOL_SIZE = 4  # Conexões abertas uma vez e reutilizadas entre datagramas
+CACHE_STATEMENTS = 256  # Statements preparados mantidos por conexão
+
+# Workers: threads para o SQLite, processos para renderizar PDF
+SQL_WORKERS = POOL_SIZE
+PDF_WORKERS = 2
+SEND_WORKERS = 4  # Threads que entregam as respostas (esperam o ACK do cliente)
+ACOES_LENTAS = ("gerar_pdf",)  # Aceitas na hora, resultado entregue depois
+# Rótulos das métricas: ação desconhecida vira "invalid", senão cada cliente criaria séries novas
+ACOES_CONHECIDAS = ("criar_tabela", "remover_tabela", "alterar_tabela", "executar_sql",
+                    "executar_lote", "ver_tabelas", "gerar_pdf")
+
+
+# Abre uma conexão já com WAL e sync NORMAL (seguro em WAL e bem mais rápido)
+def abrir_conexao():
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False,
+                           cached_statements=CACHE_STATEMENTS, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+pool = queue.Queue()
+for _ in range(POOL_SIZE):
+    pool.put(abrir_conexao())
+
+
+# Empresta uma conexão do pool e devolve ao final
+@contextmanager
+def conexao():
+    conn = pool.get()
+    try:
+        yield conn
+    finally:
+        pool.put(conn)
 
-# Função para criar o PDF com dados do banco
-def gerar_pdf(dados):
-    c = canvas.Canvas("dados_banco.pdf", pagesize=letter)
-    width, height = letter
-    y = height - 40  # Posição inicial no PDF
 
-    c.drawString(30, y, "Dados do Banco de Dados:")
-    y -= 20
+# Agrupa os statements em uma única transação (um fsync só no commit)
+@contextmanager
+def transacao(conn):
+    conn.execute("BEGIN")
+    try:
+        yield conn.cursor()
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
 
-    for tabela, linhas in dados.items():
-        c.drawString(30, y, f"Tabela: {tabela}")
-        y -= 20
-        for linha in linhas:
-            c.drawString(30, y, str(linha))
-            y -= 20
-        y -= 20  # Espaço entre tabelas
 
-    c.save()
+# Exporta todas as tabelas em streaming (pdf, csv ou ndjson)
+def gerar_pdf(conn, formato="pdf"):
+    caminho = f"dados_banco.{formato}"
+    linhas = table_export.export(conn, caminho, formato)
+    return f"{caminho} gerado com sucesso ({linhas} linhas)."
 
 
-# Função para conectar ao banco de dados e executar operações
+# Função para executar operações usando uma conexão do pool
 def executar_comando(comando):
     resposta = ""
-    conn = sqlite3.connect("servidor.db")
-    cursor = conn.cursor()
 
     try:
-        if comando["acao"] == "criar_tabela":
-            cursor.execute(comando["sql"])
-            conn.commit()
-            resposta = "Tabela criada com sucesso."
-
-        elif comando["acao"] == "remover_tabela":
-            cursor.execute(f"DROP TABLE IF EXISTS {comando['nome_tabela']}")
-            conn.commit()
-            resposta = "Tabela removida com sucesso."
-
-        elif comando["acao"] == "alterar_tabela":
-            cursor.execute(comando["sql"])
-            conn.commit()
-            resposta = "Tabela alterada com sucesso."
-
-        elif comando["acao"] == "ver_tabelas":
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tabelas = cursor.fetchall()
-            resposta = [tabela[0] for tabela in tabelas]
-
-        elif comando["acao"] == "gerar_pdf":
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
-            tabelas = cursor.fetchall()
-            dados = {}
-            for tabela in tabelas:
-                cursor.execute(f"SELECT * FROM {tabela[0]}")
-                dados[tabela[0]] = cursor.fetchall()
-            gerar_pdf(dados)
-            resposta = "PDF gerado com sucesso."
+        with conexao() as conn:
+            if comando["acao"] == "criar_tabela":
+                with transacao(conn) as cursor:
+                    cursor.execute(comando["sql"])
+                resposta = "Tabela criada com sucesso."
+
+            elif comando["acao"] == "remover_tabela":
+                with transacao(conn) as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {comando['nome_tabela']}")
+                resposta = "Tabela removida com sucesso."
+
+            elif comando["acao"] == "alterar_tabela":
+                with transacao(conn) as cursor:
+                    cursor.execute(comando["sql"])
+                resposta = "Tabela alterada com sucesso."
+
+            elif comando["acao"] == "executar_sql":
+                # DML parametrizado; "lote" roda executemany na mesma transação
+                with transacao(conn) as cursor:
+                    if "lote" in comando:
+                        cursor.executemany(comando["sql"], comando["lote"])
+                    else:
+                        cursor.execute(comando["sql"], comando.get("parametros", ()))
+                    resposta = f"{cursor.rowcount} linha(s) afetada(s)."
+
+            elif comando["acao"] == "executar_lote":
+                # Vários DDL/DML em uma transação: ou todos aplicam ou nenhum
+                with transacao(conn) as cursor:
+                    for sql in comando["comandos"]:
+                        cursor.execute(sql)
+                resposta = f"{len(comando['comandos'])} comando(s) executado(s)."
+
+            elif comando["acao"] == "ver_tabelas":
+                cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+                resposta = [tabela[0] for tabela in cursor.fetchall()]
 
     except sqlite3.Error as e:
         resposta = f"Erro no banco de dados: {str(e)}"
-    finally:
-        conn.close()
 
     return resposta
 
 
-# Configuração do servidor UDP
-servidor_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-servidor_socket.bind(("localhost", 12345))
+# Roda no processo do pool de PDF, com conexão própria (não herda o pool)
+def gerar_pdf_processo(formato):
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        try:
+            return gerar_pdf(conn, formato)
+        finally:
+            conn.close()
+    except sqlite3.Error as e:
+        return f"Erro no banco de dados: {str(e)}"
+    except ValueError as e:
+        return f"Erro: {e}"
 
-print("Servidor UDP rodando e aguardando comandos...")
 
-while True:
-    data, addr = servidor_socket.recvfrom(1024)
-    comando = json.loads(data.decode())
-    resposta = executar_comando(comando)
-    servidor_socket.sendto(json.dumps(resposta).encode(), addr)
+def enviar(addr, mensagem):
+    try:
+        BYTES_OUT.inc(amount=servidor_socket.sendto(json.dumps(mensagem).encode(), addr))
+    except TransferError as e:
+        print(f"Resposta para {addr} não confirmada: {e}")
+
+
+# Envia a resposta; com "id" ela vai envelopada para o cliente correlacionar
+def responder(addr, id_requisicao, resposta, status=None):
+    if id_requisicao is None:
+        mensagem = resposta
+    else:
+        mensagem = {"id": id_requisicao, "resposta": resposta}
+        if status is not None:
+            mensagem["status"] = status
+    # O envio é confiável (espera os ACKs), então não pode travar o loop principal
+    envio_executor.submit(enviar, addr, mensagem)
+
+
+# Chamado quando o worker termina: entrega o resultado de forma assíncrona
+def ao_concluir(future, addr, id_requisicao, acao, inicio):
+    (PDF_PENDENTES if acao in ACOES_LENTAS else SQL_PENDENTES).dec()
+    try:
+        resposta = future.result()
+    except Exception as e:
+        resposta = f"Erro ao executar {acao}: {e}"
+    status = "concluido" if acao in ACOES_LENTAS else None
+    responder(addr, id_requisicao, resposta, status)
+    rotulo = acao if acao in ACOES_CONHECIDAS else "invalid"
+    COMANDOS.inc(rotulo)
+    LATENCIA.observe(time.perf_counter() - inicio, rotulo)
+
+
+def despachar(comando, addr):
+    inicio = time.perf_counter()
+    acao = str(comando.get("acao"))
+    id_requisicao = comando.get("id")
+
+    if acao in ACOES_LENTAS:
+        PDF_PENDENTES.inc()
+        future = pdf_executor.submit(gerar_pdf_processo, comando.get("formato", "pdf"))
+        if id_requisicao is not None:
+            responder(addr, id_requisicao, "Requisição aceita.", "aceito")
+    else:
+        SQL_PENDENTES.inc()
+        future = sql_executor.submit(executar_comando, comando)
+    future.add_done_callback(lambda f: ao_concluir(f, addr, id_requisicao, acao, inicio))
+
+
+if __name__ == "__main__":
+    # Configuração do servidor UDP
+    # Mensagens maiores que um datagrama são fragmentadas e confirmadas; clientes
+    # antigos que mandam o JSON cru em um datagrama recebem a resposta crua
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.bind(("localhost", 12345))
+    servidor_socket = ReliableSocket(udp_socket)
+
+    sql_executor = ThreadPoolExecutor(max_workers=SQL_WORKERS, thread_name_prefix="sql")
+    pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    envio_executor = ThreadPoolExecutor(max_workers=SEND_WORKERS, thread_name_prefix="envio")
+
+    print("Servidor UDP rodando e aguardando comandos...")
+    metrics.Gauge("udp_receive_queue_bytes", "Bytes pendentes no buffer de recepção",
+                  function=lambda: metrics.pending_bytes(udp_socket))
+    metrics.start_http_server(METRICS_PORT)
+
+    while True:
+        data, addr = servidor_socket.recvfrom()
+        BYTES_IN.inc(amount=len(data))
+        try:
+            comando = json.loads(data.decode())
+        except ValueError:
+            responder(addr, None, "Erro: comando JSON inválido.")
+            continue
+        if not isinstance(comando, dict):
+            responder(addr, None, "Erro: o comando deve ser um objeto JSON.")
+            continue
+        despachar(comando, addr)
 
@@ -1,42 +1,70 @@
 import socket
 import json
-from cryptography.fernet import Fernet
+import os
+import sys
+import uuid
+
+import session_crypto
+
+# udp_framing.py fica no diretório client-server, um nível acima
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from udp_framing import ReliableSocket  # noqa: E402
 
 UDP_IP = "127.0.0.1"
 UDP_PORT = 5005
 
-# Chave de criptografia
-KEY = Fernet.generate_key()
-cipher = Fernet(KEY)
+# Chave pré-compartilhada, a mesma configurada no servidor
+PSK = os.environ.get("UDP_V2_PSK", "secret_key").encode()
+
+sock = ReliableSocket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+session = None  # Estabelecida no primeiro envio e reutilizada depois
 
 
-def send_request(action, table_name, **kwargs):
+# Handshake: troca de chaves uma única vez; depois cada datagrama é só um AES-GCM
+def connect():
+    global session
+    handshake = session_crypto.ClientHandshake(PSK)
+    sock.sendto(handshake.hello(), (UDP_IP, UDP_PORT))
+    received = sock.recvfrom(timeout=30)
+    if received is None:
+        raise TimeoutError("No response from server")
+    session = handshake.finish(received[0])
+
+
+def send_request(action, table_name=None, **kwargs):
     request = {
         "action": action,
-        "table_name": table_name
+        "table_name": table_name,
+        "request_id": uuid.uuid4().hex  # Correlaciona as respostas assíncronas
     }
     if kwargs:
         request.update(kwargs)
 
-    encrypted_request = cipher.encrypt(json.dumps(request).encode())
-    client_key = cipher.encrypt(b"secret_key").decode()
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.sendto(client_key.encode() + encrypted_request, (UDP_IP, UDP_PORT))
+    if session is None:
+        connect()
+    sock.sendto(session.seal(json.dumps(request).encode()), (UDP_IP, UDP_PORT))
 
-    data, addr = sock.recvfrom(1024)
-    client_key_response = data[:32].decode()
-    encrypted_response = data[32:]
+    while True:
+        received = sock.recvfrom(timeout=30)
+        if received is None:
+            print("No response from server")
+            break
+        data, addr = received
 
-    if client_key_response == "Unauthorized":
-        print("Unauthorized access")
-    else:
-        response = json.loads(cipher.decrypt(encrypted_response).decode())
+        if data[:1] == bytes([session_crypto.ERROR]):
+            print(data[1:].decode())
+            break
+        response = json.loads(session.open(data).decode())
+        if response.get("request_id") not in (None, request["request_id"]):
+            continue  # Resposta atrasada de outra requisição
         print(response)
+        # generate_pdf é aceito na hora; o resultado chega em outro datagrama
+        if response.get("status") != "accepted":
+            break
 
 
 # Exemplo de uso
-send_request("create_table", "users", columns="(id INTEGER PRIMARY KEY, name TEXT, email TEXT)")
+send_request("create_table", "users", columns=["id INTEGER PRIMARY KEY", "name TEXT", "email TEXT"])
 send_request("drop_table", "users")
 send_request("alter_table", "users", changes="ADD COLUMN age INTEGER")
 send_request("list_tables")
@@ -1,11 +1,18 @@
 import socket
 import sqlite3
 import json
-import hashlib
 import os
-from cryptography.fernet import Fernet
-from reportlab.lib.pagesizes import letter
-from reportlab.pdfgen import canvas
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import session_crypto
+
+# metrics.py fica no diretório client-server, um nível acima
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import metrics  # noqa: E402
+import table_export  # noqa: E402
+from udp_framing import ReliableSocket, TransferError  # noqa: E402
 
 # Configuração do servidor UDP
 UDP_IP = "127.0.0.1"
@@ -14,17 +21,32 @@ UDP_PORT = 5005
 # Configuração do banco de dados SQLite
 DB_NAME = "example.db"
 
-# Chave de criptografia
-KEY = Fernet.generate_key()
-cipher = Fernet(KEY)
-
-
-# Função para autenticar o cliente
-def authenticate(client_key):
-    # Verifique se a chave do cliente está correta
-    if client_key != cipher.encrypt(b"secret_key").decode():
-        return False
-    return True
+# Chave pré-compartilhada: só clientes que a conhecem conseguem abrir sessão
+PSK = os.environ.get("UDP_V2_PSK", "secret_key").encode()
+sessions = session_crypto.SessionStore(PSK)
+
+# Métricas no formato Prometheus em uma porta lateral
+METRICS_PORT = 9114
+REQUESTS = metrics.Counter("udp2_requests_total", "Requisições recebidas", ("action",))
+LATENCY = metrics.Histogram("udp2_request_seconds", "Tempo de execução por ação", ("action",))
+UNAUTHORIZED = metrics.Counter("udp2_unauthorized_total", "Requisições rejeitadas na autenticação")
+HANDSHAKES = metrics.Counter("udp2_handshakes_total", "Sessões estabelecidas")
+metrics.Gauge("udp2_sessions", "Sessões em cache", function=lambda: len(sessions))
+BYTES_IN = metrics.Counter("udp2_bytes_received_total", "Bytes recebidos")
+BYTES_OUT = metrics.Counter("udp2_bytes_sent_total", "Bytes enviados")
+# Contados no dispatch/on_done, sem ler o estado interno dos executors
+SQL_PENDING = metrics.Gauge("udp2_sql_pending", "Requisições aguardando ou rodando numa thread do SQLite")
+PDF_PENDING = metrics.Gauge("udp2_pdf_pending", "PDFs aguardando ou em renderização")
+SQL_PENDING.set(0)
+PDF_PENDING.set(0)
+
+# Workers: threads para o SQLite, processos para renderizar PDF
+SQL_WORKERS = 4
+PDF_WORKERS = 2
+SEND_WORKERS = 4  # Threads que entregam as respostas (esperam o ACK do cliente)
+SLOW_ACTIONS = ("generate_pdf",)  # Aceitas na hora, resultado entregue depois
+# Rótulos das métricas: ação desconhecida vira "invalid", senão cada cliente criaria séries novas
+KNOWN_ACTIONS = ("create_table", "drop_table", "alter_table", "list_tables", "generate_pdf")
 
 
 def create_table(table_name, columns):
@@ -63,54 +85,120 @@ def list_tables():
     return [table[0] for table in tables]
 
 
-def generate_pdf(table_name):
+# Exporta a tabela em streaming; output.pdf, output.csv ou output.ndjson
+def generate_pdf(table_name, fmt="pdf"):
     conn = sqlite3.connect(DB_NAME)
-    cursor = conn.cursor()
-    cursor.execute(f"SELECT * FROM {table_name}")
-    data = cursor.fetchall()
-    conn.close()
-
-    c = canvas.Canvas("output.pdf", pagesize=letter)
-    width, height = letter
+    try:
+        path = f"output.{fmt}"
+        rows = table_export.export(conn, path, fmt, [table_name])
+    finally:
+        conn.close()
+    return {"result": f"{path} generated ({rows} rows)"}
+
+
+def execute_request(request):
+    action, table_name = request.get("action"), request.get("table_name")
+    if action == "create_table":
+        create_table(table_name, request.get("columns"))
+    elif action == "drop_table":
+        drop_table(table_name)
+    elif action == "alter_table":
+        alter_table(table_name, request.get("changes"))
+    elif action == "list_tables":
+        return {"result": list_tables()}
+    elif action == "generate_pdf":
+        return generate_pdf(table_name, request.get("format", "pdf"))
+    else:
+        return {"error": "Unknown action"}
+    return {"result": "ok"}
 
-    # Adicione código para gerar o PDF com os dados
-    # Por exemplo, escrever os dados no PDF
-    y = height - 50
-    for row in data:
-        c.drawString(100, y, str(row))
-        y -= 20
 
-    c.save()
+# Decifra com o cipher já cacheado da sessão; levanta SessionError se não autenticar
+def handle_request(data):
+    session = sessions.lookup(data)
+    return session, json.loads(session.open(data).decode())
 
 
-def handle_request(data):
+def deliver(addr, payload):
     try:
-        data = json.loads(cipher.decrypt(data.encode()).decode())
-        action, table_name = data.get("action"), data.get("table_name")
-        if action == "create_table":
-            columns = data.get("columns")
-            create_table(table_name, columns)
-        elif action == "drop_table python":
-            return {"error": "Unknown action"}
-        else:
-            return {"error": "Unknown action"}
-    except Exception as e:
-        return {"error": str(e)}
+        BYTES_OUT.inc(amount=sock.sendto(payload, addr))
+    except TransferError as e:
+        print(f"Resposta para {addr} não confirmada: {e}")
 
 
-sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-sock.bind((UDP_IP, UDP_PORT))
+# O envio é confiável (espera os ACKs), então roda fora do loop principal
+def send_response(addr, session, response):
+    send_executor.submit(deliver, addr, session.seal(json.dumps(response).encode()))
 
-print(f"Servidor UDP escutando em {UDP_IP}:{UDP_PORT}")
 
-while True:
-    data, addr = sock.recvfrom(1024)
-    client_key = data[:32].decode()  # Primeiros 32 bytes são a chave do cliente
-    encrypted_request = data[32:]
-
-    if authenticate(client_key):
-        response = handle_request(encrypted_request)
-        encrypted_response = cipher.encrypt(json.dumps(response).encode())
-        sock.sendto(client_key.encode() + encrypted_response, addr)
+# Entrega o resultado quando o worker termina, com o request_id da requisição
+def on_done(future, addr, session, request_id, action, start):
+    (PDF_PENDING if action in SLOW_ACTIONS else SQL_PENDING).dec()
+    try:
+        response = future.result()
+    except Exception as e:
+        response = {"error": str(e)}
+    if not isinstance(response, dict):
+        # Um worker que devolve outra coisa não pode impedir a resposta de sair
+        response = {"result": response}
+    response["request_id"] = request_id
+    if action in SLOW_ACTIONS:
+        response["status"] = "done"
+    send_response(addr, session, response)
+    label = action if action in KNOWN_ACTIONS else "invalid"
+    REQUESTS.inc(label)
+    LATENCY.observe(time.perf_counter() - start, label)
+
+
+# SQLite vai para o pool de threads; PDF para o pool de processos e é aceito na hora
+def dispatch(request, addr, session):
+    start = time.perf_counter()
+    if not isinstance(request, dict):
+        # JSON válido mas não objeto ([] ou 1): responde com erro em vez de derrubar o loop
+        send_response(addr, session, {"error": "Request must be a JSON object"})
+        return
+    action = str(request.get("action"))
+    request_id = request.get("request_id")
+
+    if action in SLOW_ACTIONS:
+        PDF_PENDING.inc()
+        future = pdf_executor.submit(generate_pdf, request.get("table_name"), request.get("format", "pdf"))
+        send_response(addr, session, {"request_id": request_id, "status": "accepted"})
     else:
-        sock.sendto(b"Unauthorized", addr)
+        SQL_PENDING.inc()
+        future = sql_executor.submit(execute_request, request)
+    future.add_done_callback(lambda f: on_done(f, addr, session, request_id, action, start))
+
+
+if __name__ == "__main__":
+    # Mensagens maiores que um datagrama são fragmentadas e confirmadas; clientes
+    # antigos que mandam o JSON cru em um datagrama recebem a resposta crua
+    udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp_socket.bind((UDP_IP, UDP_PORT))
+    sock = ReliableSocket(udp_socket)
+
+    sql_executor = ThreadPoolExecutor(max_workers=SQL_WORKERS, thread_name_prefix="sql")
+    pdf_executor = ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    send_executor = ThreadPoolExecutor(max_workers=SEND_WORKERS, thread_name_prefix="send")
+
+    print(f"Servidor UDP escutando em {UDP_IP}:{UDP_PORT}")
+    metrics.Gauge("udp2_receive_queue_bytes", "Bytes pendentes no buffer de recepção",
+                  function=lambda: metrics.pending_bytes(udp_socket))
+    metrics.start_http_server(METRICS_PORT)
+
+    while True:
+        data, addr = sock.recvfrom()
+        BYTES_IN.inc(amount=len(data))
+        kind = data[:1]
+
+        try:
+            if kind == bytes([session_crypto.HELLO]):
+                # Handshake: a troca de chaves acontece uma vez por cliente
+                send_executor.submit(deliver, addr, sessions.accept(data))
+                HANDSHAKES.inc()
+            else:
+                session, request = handle_request(data)
+                dispatch(request, addr, session)
+        except (session_crypto.SessionError, ValueError) as e:
+            UNAUTHORIZED.inc()
+            send_executor.submit(deliver, addr, session_crypto.error(f"Unauthorized: {e}"))
@@ -0,0 +1,216 @@
+"""
+Chaves de sessão por cliente para o serverUDP_V2.
+
+Handshake (uma vez por cliente):
+    cliente -> HELLO   | chave pública X25519 do cliente | timestamp(8) | HMAC-SHA256(PSK)
+    servidor -> WELCOME | client_id(8) | chave pública do servidor | DATA selado ("welcome")
+
+O HMAC prova que o cliente conhece a PSK antes de o servidor gastar um X25519
+ou guardar uma sessão: sem ele, uma enxurrada de HELLOs tiraria do cache todas
+as sessões autenticadas. HELLOs fora de HELLO_MAX_SKEW segundos, ou já vistos,
+são recusados.
+
+As duas pontas fazem ECDH e derivam, com HKDF usando a chave pré-compartilhada
+(PSK) como salt, uma chave AES-GCM para cada direção. Quem não conhece a PSK
+deriva chaves diferentes e nenhuma mensagem dele decifra.
+
+Depois do handshake cada datagrama é:
+    DATA | client_id(8) | contador(8) | AES-GCM(payload, aad=cabeçalho)
+
+O contador é o nonce (nunca se repete na mesma chave) e uma janela deslizante
+de 64 posições rejeita replays, como no IPsec. Custo por datagrama: um
+encrypt ou um decrypt.
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+HELLO = 1
+WELCOME = 2
+DATA = 3
+ERROR = 4
+
+CLIENT_ID_SIZE = 8
+PUBLIC_KEY_SIZE = 32
+HEADER_SIZE = 1 + CLIENT_ID_SIZE + 8
+HELLO_MAC_SIZE = 32
+HELLO_SIZE = 1 + PUBLIC_KEY_SIZE + 8 + HELLO_MAC_SIZE
+HELLO_MAX_SKEW = 60  # Segundos de diferença aceitos entre o relógio do cliente e o do servidor
+REPLAY_WINDOW = 64
+
+MAX_SESSIONS = 10000
+SESSION_TTL = 3600  # Sessões sem uso por mais tempo que isso são descartadas
+
+
+class SessionError(Exception):
+    """Datagrama inválido, adulterado, repetido ou de sessão desconhecida."""
+
+
+def _public_bytes(private_key):
+    return private_key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+
+# Retorna (chave cliente->servidor, chave servidor->cliente)
+def _derive_keys(private_key, peer_public, psk, client_public, server_public):
+    shared = private_key.exchange(X25519PublicKey.from_public_bytes(peer_public))
+    material = HKDF(algorithm=hashes.SHA256(), length=64, salt=psk,
+                    info=b"serverUDP_V2 session" + client_public + server_public).derive(shared)
+    return material[:32], material[32:]
+
+
+def _hello_mac(psk, client_public, timestamp):
+    return hmac.new(psk, b"serverUDP_V2 hello" + client_public + timestamp, hashlib.sha256).digest()
+
+
+class Session:
+    def __init__(self, client_id, send_key, receive_key):
+        self.client_id = client_id
+        self._send = AESGCM(send_key)
+        self._receive = AESGCM(receive_key)
+        self._lock = threading.Lock()
+        self._send_counter = 0
+        self._highest = 0  # Maior contador recebido
+        self._window = 0  # Bit i = contador (highest - i) já recebido
+        self.last_used = time.monotonic()
+
+    def seal(self, plaintext):
+        with self._lock:
+            self._send_counter += 1
+            counter = self._send_counter
+        header = bytes([DATA]) + self.client_id + counter.to_bytes(8, "big")
+        return header + self._send.encrypt(counter.to_bytes(12, "big"), plaintext, header)
+
+    def open(self, datagram):
+        if len(datagram) < HEADER_SIZE or datagram[0] != DATA:
+            raise SessionError("datagrama inválido")
+        header = datagram[:HEADER_SIZE]
+        counter = int.from_bytes(header[1 + CLIENT_ID_SIZE:], "big")
+        with self._lock:
+            self._check_replay(counter)
+        try:
+            plaintext = self._receive.decrypt(counter.to_bytes(12, "big"), datagram[HEADER_SIZE:], header)
+        except InvalidTag:
+            raise SessionError("falha na autenticação do datagrama")
+        # Só marca depois de autenticar, senão um atacante queimaria contadores
+        with self._lock:
+            self._check_replay(counter)
+            self._mark(counter)
+        self.last_used = time.monotonic()
+        return plaintext
+
+    def _check_replay(self, counter):
+        if counter == 0:
+            raise SessionError("contador inválido")
+        if counter > self._highest:
+            return
+        offset = self._highest - counter
+        if offset >= REPLAY_WINDOW or self._window >> offset & 1:
+            raise SessionError("replay detectado")
+
+    def _mark(self, counter):
+        if counter > self._highest:
+            shift = counter - self._highest
+            self._window = ((self._window << shift) | 1) & ((1 << REPLAY_WINDOW) - 1)
+            self._highest = counter
+        else:
+            self._window |= 1 << (self._highest - counter)
+
+
+class ClientHandshake:
+    def __init__(self, psk):
+        self.psk = psk
+        self._private = X25519PrivateKey.generate()
+        self._public = _public_bytes(self._private)
+
+    def hello(self):
+        timestamp = int(time.time()).to_bytes(8, "big")
+        return bytes([HELLO]) + self._public + timestamp + _hello_mac(self.psk, self._public, timestamp)
+
+    def finish(self, welcome):
+        if welcome[:1] == bytes([ERROR]):
+            raise SessionError(welcome[1:].decode(errors="replace"))
+        start = 1 + CLIENT_ID_SIZE
+        if len(welcome) < start + PUBLIC_KEY_SIZE or welcome[0] != WELCOME:
+            raise SessionError("resposta de handshake inválida")
+        client_id = welcome[1:start]
+        server_public = welcome[start:start + PUBLIC_KEY_SIZE]
+        send_key, receive_key = _derive_keys(self._private, server_public, self.psk,
+                                             self._public, server_public)
+        session = Session(client_id, send_key, receive_key)
+        # Confirmação de chave: só decifra se as duas pontas usaram a mesma PSK
+        if session.open(welcome[start + PUBLIC_KEY_SIZE:]) != b"welcome":
+            raise SessionError("confirmação de chave inválida")
+        return session
+
+
+class SessionStore:
+    def __init__(self, psk, max_sessions=MAX_SESSIONS, ttl=SESSION_TTL):
+        self.psk = psk
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # client_id -> Session, do menos ao mais recente
+        self._hellos = OrderedDict()  # Chave pública de HELLOs aceitos -> timestamp, contra replay
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    # Processa o HELLO e retorna o WELCOME a ser enviado
+    def accept(self, hello):
+        if len(hello) != HELLO_SIZE or hello[0] != HELLO:
+            raise SessionError("handshake inválido")
+        client_public = hello[1:1 + PUBLIC_KEY_SIZE]
+        timestamp = hello[1 + PUBLIC_KEY_SIZE:HELLO_SIZE - HELLO_MAC_SIZE]
+        if not hmac.compare_digest(hello[HELLO_SIZE - HELLO_MAC_SIZE:], _hello_mac(self.psk, client_public, timestamp)):
+            raise SessionError("falha na autenticação do handshake")
+        sent = int.from_bytes(timestamp, "big")
+        now = time.time()
+        if abs(now - sent) > HELLO_MAX_SKEW:
+            raise SessionError("handshake expirado")
+        with self._lock:
+            # Um HELLO capturado vale uma vez só dentro da janela de tempo
+            while self._hellos and now - next(iter(self._hellos.values())) > 2 * HELLO_MAX_SKEW:
+                self._hellos.popitem(last=False)
+            if client_public in self._hellos:
+                raise SessionError("handshake repetido")
+            self._hellos[client_public] = sent
+        private_key = X25519PrivateKey.generate()
+        server_public = _public_bytes(private_key)
+        receive_key, send_key = _derive_keys(private_key, client_public, self.psk,
+                                             client_public, server_public)
+        session = Session(os.urandom(CLIENT_ID_SIZE), send_key, receive_key)
+        with self._lock:
+            self._sessions[session.client_id] = session
+            self._evict()
+        return bytes([WELCOME]) + session.client_id + server_public + session.seal(b"welcome")
+
+    # Sessão dona do datagrama DATA (o cipher já está pronto, nada é derivado aqui)
+    def lookup(self, datagram):
+        client_id = datagram[1:1 + CLIENT_ID_SIZE]
+        with self._lock:
+            session = self._sessions.get(client_id)
+            if session is None:
+                raise SessionError("sessão desconhecida")
+            self._sessions.move_to_end(client_id)
+        return session
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.max_sessions and now - oldest.last_used < self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+
+def error(message):
+    return bytes([ERROR]) + message.encode()
@@ -0,0 +1,157 @@
+"""
+Exportação de tabelas SQLite em streaming (PDF, CSV ou NDJSON).
+
+As linhas são lidas do cursor em lotes com fetchmany() e escritas na hora,
+então nenhuma tabela é carregada inteira na memória:
+
+    conn = sqlite3.connect("servidor.db")
+    export(conn, "dados_banco.pdf")                 # todas as tabelas
+    export(conn, "users.csv", "csv", ["users"])     # só uma tabela
+
+No PDF as páginas são quebradas quando o texto chega na margem inferior.
+O ReportLab guarda todas as páginas até o save(), então o PDF é dividido em
+volumes de MAX_PAGES_PER_FILE páginas (dados.pdf, dados_2.pdf, ...) para a
+memória não crescer com a tabela.
+"""
+import csv
+import json
+import os
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+BATCH_SIZE = 1000  # Linhas por fetchmany()
+FORMATS = ("pdf", "csv", "ndjson")
+
+# Layout do PDF
+MARGIN = 40
+LINE_HEIGHT = 14
+FONT = "Helvetica"
+FONT_SIZE = 9
+MAX_LINE_CHARS = 120  # Linhas maiores são cortadas para não sair da página
+MAX_PAGES_PER_FILE = 500  # Páginas por volume do PDF (~25 mil linhas)
+
+
+def quote_identifier(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def list_tables(conn):
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table'")
+    return [row[0] for row in cursor.fetchall()]
+
+
+# Gera (colunas, linhas) de uma tabela lendo o cursor em lotes
+def iter_rows(conn, table, batch_size=BATCH_SIZE):
+    cursor = conn.execute(f"SELECT * FROM {quote_identifier(table)}")
+    columns = [description[0] for description in cursor.description]
+
+    def rows():
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield from batch
+
+    return columns, rows()
+
+
+class _PdfWriter:
+    def __init__(self, path, max_pages=MAX_PAGES_PER_FILE):
+        self.stem, self.extension = os.path.splitext(path)
+        self.max_pages = max_pages
+        self.width, self.height = letter
+        self.paths = []
+        self.page = 0
+        self._new_file()
+
+    def _new_file(self):
+        volume = len(self.paths) + 1
+        path = self.stem + self.extension if volume == 1 else f"{self.stem}_{volume}{self.extension}"
+        self.paths.append(path)
+        self.canvas = canvas.Canvas(path, pagesize=letter, pageCompression=1)
+        self.page_in_file = 0
+
+    def _new_page(self):
+        if self.page_in_file == self.max_pages:
+            self.canvas.save()
+            self._new_file()
+        elif self.page:
+            self.canvas.showPage()
+        self.page += 1
+        self.page_in_file += 1
+        self.canvas.setFont(FONT, FONT_SIZE)
+        self.canvas.drawRightString(self.width - MARGIN, MARGIN / 2, f"Página {self.page}")
+        self.y = self.height - MARGIN
+
+    def line(self, text, indent=0):
+        if self.page_in_file == 0 or self.y < MARGIN:
+            self._new_page()
+        if len(text) > MAX_LINE_CHARS:
+            text = text[:MAX_LINE_CHARS - 3] + "..."
+        self.canvas.drawString(MARGIN + indent, self.y, text)
+        self.y -= LINE_HEIGHT
+
+    def save(self):
+        self.canvas.save()
+
+
+def export_pdf(conn, path, tables, title="Dados do Banco de Dados:", batch_size=BATCH_SIZE):
+    writer = _PdfWriter(path)
+    writer.line(title)
+    total = 0
+    for table in tables:
+        columns, rows = iter_rows(conn, table, batch_size)
+        writer.line("")
+        writer.line(f"Tabela: {table}")
+        writer.line(" | ".join(columns), indent=10)
+        for row in rows:
+            writer.line(str(row), indent=10)
+            total += 1
+    writer.save()
+    return total
+
+
+def export_csv(conn, path, tables, batch_size=BATCH_SIZE):
+    total = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        for table in tables:
+            columns, rows = iter_rows(conn, table, batch_size)
+            # Com mais de uma tabela, a primeira coluna diz de qual tabela é a linha
+            if len(tables) > 1:
+                writer.writerow(["tabela"] + columns)
+                for row in rows:
+                    writer.writerow((table,) + row)
+                    total += 1
+            else:
+                writer.writerow(columns)
+                for row in rows:
+                    writer.writerow(row)
+                    total += 1
+    return total
+
+
+def export_ndjson(conn, path, tables, batch_size=BATCH_SIZE):
+    total = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for table in tables:
+            columns, rows = iter_rows(conn, table, batch_size)
+            for row in rows:
+                record = dict(zip(columns, row))
+                record["_tabela"] = table
+                # BLOBs não são JSON: vão como hex
+                f.write(json.dumps(record, default=lambda value: bytes(value).hex()))
+                f.write("\n")
+                total += 1
+    return total
+
+
+# Exporta as tabelas (todas, se None) e retorna o número de linhas escritas
+def export(conn, path, fmt="pdf", tables=None, batch_size=BATCH_SIZE):
+    if fmt not in FORMATS:
+        raise ValueError(f"formato inválido: {fmt} (use {', '.join(FORMATS)})")
+    if tables is None:
+        tables = list_tables(conn)
+    exporter = {"pdf": export_pdf, "csv": export_csv, "ndjson": export_ndjson}[fmt]
+    return exporter(conn, path, tables, batch_size=batch_size)
@@ -1,8 +1,56 @@
-from fastapi import FastAPI, HTTPException
+import hashlib
+import json
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
 
-app = FastAPI()
-tuta
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+# JSONResponse com orjson quando disponível (pip install orjson)
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+# If-None-Match pode trazer vários ETags separados por vírgula, ou "*"
+def etag_matches(request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+app = FastAPI(default_response_class=FastJSONResponse)
+
+
+# Respostas que nunca mudam: serializadas uma vez, com ETag para o If-None-Match
+def static_json(content):
+    body = dumps(content)
+    etag = '"%s"' % hashlib.blake2b(body, digest_size=12).hexdigest()
+
+    def respond(request: Request):
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(body, media_type="application/json", headers={"ETag": etag})
+
+    return respond
+
+
+ping_response = static_json({"message": "Server is up and running!"})
+status_response = static_json({"status": "Server is operational"})
+
 
 # Modelo de dados para o endpoint POST
 class Item(BaseModel):
@@ -12,8 +60,8 @@ class Item(BaseModel):
 
 # Endpoint "ping" para verificar a conexão
 @app.get("/ping")
-async def ping():
-    return {"message": "Server is up and running!"}
+async def ping(request: Request):
+    return ping_response(request)
 
 
 # Endpoint para receber dados
@@ -24,5 +72,5 @@ async def receive_data(item: Item):
 
 # Endpoint para status do servidor
 @app.get("/status")
-async def status():
-    return {"status": "Server is operational"}
+async def status(request: Request):
+    return status_response(request)
@@ -0,0 +1,323 @@
+"""
+Fragmentação e remontagem confiável sobre UDP.
+
+Mensagens maiores que um datagrama são quebradas em fragmentos numerados,
+enviados em uma janela deslizante e confirmados com ACK seletivo (SACK).
+Fragmentos perdidos são retransmitidos por timeout (RTO adaptativo, como no
+TCP) ou assim que um SACK mostra que fragmentos posteriores já chegaram.
+
+    rsock = ReliableSocket(socket.socket(socket.AF_INET, socket.SOCK_DGRAM))
+    rsock.sendto(b"..." * 100000, ("localhost", 12345))
+    mensagem, addr = rsock.recvfrom()
+
+Formato do datagrama:
+    DATA: magic(2) tipo(1) id_mensagem(4) seq(2) total(2) | payload
+    SACK: magic(2) tipo(1) id_mensagem(4) 0(2) 0(2)       | proximo_seq(2) bitmap(8)
+
+O bitmap marca quais dos 64 fragmentos seguintes a `proximo_seq` já chegaram,
+por isso a janela é limitada a 64 fragmentos.
+
+Datagramas sem o cabeçalho (clientes antigos que mandam o JSON cru em um só
+datagrama) são entregues como estão, sem ACK, e a resposta para esse peer
+volta crua também quando cabe em um datagrama: o caminho rápido das
+requisições pequenas continua custando só uma ida e volta.
+
+Várias threads podem chamar sendto() enquanto outra fica em recvfrom(): quem
+estiver lendo o socket processa os SACKs e acorda os remetentes.
+"""
+import queue
+import random
+import socket
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+MAGIC = b"RU"
+DATA = 1
+SACK = 2
+HEADER = struct.Struct("!2sBIHH")
+SACK_BODY = struct.Struct("!HQ")
+
+MAX_PAYLOAD = 1200  # Cabe em um quadro Ethernet sem fragmentação IP
+MAX_DATAGRAM = 65535
+MAX_RAW = 65507  # Maior payload UDP sobre IPv4; respostas maiores para peers crus vão fragmentadas
+MAX_FRAGMENTS = 65535
+WINDOW = 32  # Fragmentos em voo por mensagem (máximo 64)
+
+INITIAL_RTO = 0.2
+MIN_RTO = 0.02
+MAX_RTO = 2.0
+MAX_RETRIES = 12  # Tentativas por fragmento antes de desistir da mensagem
+MAX_BACKOFF = 2  # RTO dobra no máximo 2 vezes: perda aleatória não é congestionamento
+
+INCOMPLETE_TTL = 30  # Mensagens incompletas há mais tempo que isso são descartadas
+COMPLETED_CACHE = 1024  # Mensagens já entregues lembradas para reconfirmar duplicatas
+RAW_PEERS = 1024  # Peers sem framing lembrados para responder cru
+
+
+class TransferError(OSError):
+    """O peer parou de confirmar fragmentos."""
+
+
+class _Outgoing:
+    def __init__(self, fragments):
+        total = len(fragments)
+        self.fragments = fragments
+        self.acked = [False] * total
+        self.sent_at = [0.0] * total  # 0 = ainda não enviado
+        self.retries = [0] * total
+        self.lost = set()  # Marcados pelo SACK para retransmitir já
+        self.base = 0  # Primeiro fragmento ainda não confirmado
+        self.pending = total
+
+
+class _Incoming:
+    def __init__(self, total):
+        self.total = total
+        self.parts = {}
+        self.next = 0  # Primeiro fragmento que ainda falta
+        self.updated = time.monotonic()
+
+
+class ReliableSocket:
+    def __init__(self, sock, window=WINDOW, max_payload=MAX_PAYLOAD):
+        self.sock = sock
+        self.window = max(1, min(window, 64))
+        self.max_payload = max_payload
+        self._next_id = random.getrandbits(32)
+        self._reader = threading.Lock()  # Só uma thread lê o socket por vez
+        self._cond = threading.Condition()
+        self._outgoing = {}  # id -> _Outgoing
+        self._incoming = {}  # (addr, id) -> _Incoming
+        self._completed = OrderedDict()  # (addr, id) -> total de fragmentos
+        self._raw_peers = OrderedDict()  # addr -> None, peers que mandaram datagramas sem cabeçalho
+        self._messages = queue.Queue()
+        self._last_expire = time.monotonic()
+        # Estimativa de RTT compartilhada por todos os peers deste socket
+        self.srtt = None
+        self.rttvar = 0.0
+        self.rto = INITIAL_RTO
+        self.stats = {"sent": 0, "retransmitted": 0, "received": 0, "duplicates": 0, "invalid": 0, "raw": 0}
+
+    def getsockname(self):
+        return self.sock.getsockname()
+
+    def close(self):
+        self.sock.close()
+
+    # Envia a mensagem inteira e só retorna quando todos os fragmentos forem confirmados
+    def sendto(self, payload, addr):
+        with self._cond:
+            raw = addr in self._raw_peers
+        if raw and len(payload) <= MAX_RAW:
+            return self.sock.sendto(payload, addr)
+        fragments = [payload[i:i + self.max_payload] for i in range(0, len(payload), self.max_payload)]
+        fragments = fragments or [b""]
+        if len(fragments) > MAX_FRAGMENTS:
+            raise ValueError("mensagem grande demais: %d bytes" % len(payload))
+
+        outgoing = _Outgoing(fragments)
+        with self._cond:
+            self._next_id = (self._next_id + 1) & 0xFFFFFFFF
+            msg_id = self._next_id
+            self._outgoing[msg_id] = outgoing
+        try:
+            while True:
+                with self._cond:
+                    if outgoing.pending == 0:
+                        return len(payload)
+                    wait = self._transmit(outgoing, msg_id, addr)
+                self._wait_for_acks(outgoing, wait)
+        finally:
+            with self._cond:
+                self._outgoing.pop(msg_id, None)
+
+    # Retorna a próxima mensagem completa; None se o timeout estourar
+    def recvfrom(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                return self._messages.get_nowait()
+            except queue.Empty:
+                pass
+            remaining = 1.0 if deadline is None else deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            if self._reader.acquire(timeout=min(remaining, 1.0)):
+                try:
+                    # Quem segurava o socket (um remetente esperando ACK) pode ter
+                    # enfileirado uma mensagem enquanto esperávamos o lock
+                    try:
+                        return self._messages.get_nowait()
+                    except queue.Empty:
+                        pass
+                    self._pump(min(remaining, 1.0))
+                finally:
+                    self._reader.release()
+                    with self._cond:
+                        self._cond.notify_all()
+
+    # Envia os fragmentos da janela que estão pendentes; retorna quanto esperar
+    def _transmit(self, outgoing, msg_id, addr):
+        now = time.monotonic()
+        total = len(outgoing.fragments)
+        while outgoing.base < total and outgoing.acked[outgoing.base]:
+            outgoing.base += 1
+        next_due = now + self.rto
+        for seq in range(outgoing.base, min(outgoing.base + self.window, total)):
+            if outgoing.acked[seq]:
+                continue
+            due = outgoing.sent_at[seq] + min(self.rto * (1 << min(outgoing.retries[seq], MAX_BACKOFF)), MAX_RTO)
+            if outgoing.sent_at[seq] and seq not in outgoing.lost and due > now:
+                next_due = min(next_due, due)
+                continue
+            if outgoing.sent_at[seq]:
+                outgoing.retries[seq] += 1
+                if outgoing.retries[seq] > MAX_RETRIES:
+                    raise TransferError("sem confirmação do peer %s:%d" % addr[:2])
+                self.stats["retransmitted"] += 1
+            outgoing.lost.discard(seq)
+            header = HEADER.pack(MAGIC, DATA, msg_id, seq, total)
+            self.sock.sendto(header + outgoing.fragments[seq], addr)
+            self.stats["sent"] += 1
+            outgoing.sent_at[seq] = now
+        return max(next_due - now, 0.001)
+
+    def _wait_for_acks(self, outgoing, wait):
+        # Se ninguém estiver lendo o socket, o próprio remetente lê
+        if self._reader.acquire(blocking=False):
+            try:
+                self._pump(wait)
+            finally:
+                self._reader.release()
+                with self._cond:
+                    self._cond.notify_all()
+        else:
+            with self._cond:
+                if outgoing.pending:
+                    self._cond.wait(wait)
+
+    def _pump(self, timeout):
+        self.sock.settimeout(timeout)
+        try:
+            data, addr = self.sock.recvfrom(MAX_DATAGRAM)
+        except (socket.timeout, ConnectionResetError):
+            return
+        if data[:2] != MAGIC:
+            self._on_raw(addr, data)
+            return
+        if len(data) < HEADER.size:
+            self.stats["invalid"] += 1
+            return
+        _, kind, msg_id, seq, total = HEADER.unpack_from(data)
+        if kind == DATA:
+            self._on_data(addr, msg_id, seq, total, data[HEADER.size:])
+        elif kind == SACK and len(data) >= HEADER.size + SACK_BODY.size:
+            next_seq, bitmap = SACK_BODY.unpack_from(data, HEADER.size)
+            self._on_sack(msg_id, next_seq, bitmap)
+        else:
+            self.stats["invalid"] += 1
+
+    # Datagrama sem framing: já é a mensagem inteira
+    def _on_raw(self, addr, data):
+        if not data:
+            self.stats["invalid"] += 1
+            return
+        with self._cond:
+            self._raw_peers[addr] = None
+            self._raw_peers.move_to_end(addr)
+            if len(self._raw_peers) > RAW_PEERS:
+                self._raw_peers.popitem(last=False)
+        self.stats["raw"] += 1
+        self._messages.put((data, addr))
+
+    def _send_sack(self, addr, msg_id, next_seq, bitmap):
+        header = HEADER.pack(MAGIC, SACK, msg_id, 0, 0)
+        self.sock.sendto(header + SACK_BODY.pack(next_seq, bitmap), addr)
+
+    def _on_data(self, addr, msg_id, seq, total, payload):
+        if addr in self._raw_peers:
+            with self._cond:
+                self._raw_peers.pop(addr, None)  # O peer passou a usar framing
+        key = (addr, msg_id)
+        if key in self._completed:
+            # Nosso SACK final se perdeu: confirma de novo para o remetente parar
+            self.stats["duplicates"] += 1
+            self._send_sack(addr, msg_id, self._completed[key], 0)
+            return
+        if total == 0 or seq >= total:
+            self.stats["invalid"] += 1
+            return
+
+        incoming = self._incoming.get(key)
+        if incoming is None:
+            incoming = self._incoming[key] = _Incoming(total)
+        if seq in incoming.parts or seq < incoming.next:
+            self.stats["duplicates"] += 1
+        else:
+            incoming.parts[seq] = payload
+            self.stats["received"] += 1
+            while incoming.next in incoming.parts:
+                incoming.next += 1
+        incoming.updated = time.monotonic()
+
+        bitmap = 0
+        for offset in range(64):
+            if incoming.next + 1 + offset in incoming.parts:
+                bitmap |= 1 << offset
+        self._send_sack(addr, msg_id, incoming.next, bitmap)
+
+        if incoming.next == incoming.total:
+            del self._incoming[key]
+            self._completed[key] = total
+            if len(self._completed) > COMPLETED_CACHE:
+                self._completed.popitem(last=False)
+            message = b"".join(incoming.parts[i] for i in range(total))
+            self._messages.put((message, addr))
+        self._expire_incomplete()
+
+    def _on_sack(self, msg_id, next_seq, bitmap):
+        with self._cond:
+            outgoing = self._outgoing.get(msg_id)
+            if outgoing is None:
+                return
+            now = time.monotonic()
+            total = len(outgoing.fragments)
+            newly_acked = [seq for seq in range(outgoing.base, min(next_seq, total))]
+            newly_acked += [next_seq + 1 + offset for offset in range(64)
+                            if bitmap >> offset & 1 and next_seq + 1 + offset < total]
+            highest = -1
+            for seq in newly_acked:
+                if outgoing.acked[seq]:
+                    continue
+                outgoing.acked[seq] = True
+                outgoing.pending -= 1
+                outgoing.lost.discard(seq)
+                highest = max(highest, seq)
+                # Algoritmo de Karn: só mede RTT de fragmentos não retransmitidos
+                if outgoing.retries[seq] == 0:
+                    self._update_rtt(now - outgoing.sent_at[seq])
+            # Retransmissão rápida: buraco antes de um fragmento já confirmado
+            threshold = self.srtt if self.srtt is not None else self.rto
+            for seq in range(next_seq, highest):
+                if not outgoing.acked[seq] and now - outgoing.sent_at[seq] > threshold:
+                    outgoing.lost.add(seq)
+            self._cond.notify_all()
+
+    def _update_rtt(self, sample):
+        if self.srtt is None:
+            self.srtt, self.rttvar = sample, sample / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - sample)
+            self.srtt = 0.875 * self.srtt + 0.125 * sample
+        self.rto = min(max(self.srtt + 4 * self.rttvar, MIN_RTO), MAX_RTO)
+
+    def _expire_incomplete(self):
+        now = time.monotonic()
+        if now - self._last_expire < INCOMPLETE_TTL:
+            return
+        self._last_expire = now
+        for key in [key for key, incoming in self._incoming.items()
+                    if now - incoming.updated > INCOMPLETE_TTL]:
+            del self._incoming[key]
@@ -1,12 +1,17 @@
-from sqlalchemy import create_engine, Column, LargeBinary, Integer, String
+import os
+
+from sqlalchemy import Column, LargeBinary, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
+import sqlite_engine
+
 # configs do db
 
 DATABASE_URL = "sqlite:///secure_communication.db"
+DATABASE_PROFILE = os.environ.get("QSM_DB_PROFILE", "wal")  # default, wal ou durable (ver sqlite_engine.py)
 Base = declarative_base()
-engine = create_engine(DATABASE_URL)
+engine = sqlite_engine.create_engine(DATABASE_URL, DATABASE_PROFILE)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
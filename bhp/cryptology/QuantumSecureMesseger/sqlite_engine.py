@@ -0,0 +1,134 @@
+"""
+Engine SQLAlchemy para o SQLite do QuantumSecureMesseger, com os PRAGMAs
+ajustados (database.py cria a engine por aqui).
+
+O SQLite padrão usa rollback journal e synchronous=FULL: cada commit faz
+fsync do journal e do banco, e um escritor bloqueia todos os leitores. Os
+perfis mudam isso por conexão, no evento "connect" do pool:
+
+    default   como o SQLite vem (rollback journal, synchronous=FULL)
+    wal       WAL + synchronous=NORMAL: leitores não esperam o escritor e o
+              commit só faz fsync no checkpoint; uma queda de energia pode
+              perder os últimos commits, mas nunca corrompe o banco
+    durable   WAL + synchronous=FULL: fsync do WAL a cada commit
+
+Uso:
+
+    import sqlite_engine
+    engine = sqlite_engine.create_engine("sqlite:///app.db", profile="wal")
+
+Benchmark de escritas concorrentes por perfil: python sqlite_engine.py [threads] [escritas]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import sqlalchemy
+from sqlalchemy import event
+
+# PRAGMAs por perfil; cache_size negativo é em KiB
+PROFILES = {
+    "default": {},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,  # 64 MB de cache de páginas por conexão
+        "mmap_size": 256 * 1024 * 1024,  # Leituras direto do page cache do SO
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+POOL_SIZE = 5  # Conexões mantidas abertas
+MAX_OVERFLOW = 10  # Conexões extras em pico, fechadas ao voltar para o pool
+BUSY_TIMEOUT = 30  # Segundos esperando o lock de escrita antes de "database is locked"
+
+
+# Opções do create_engine: pool de conexões e espera pelo lock de escrita
+def engine_options(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, busy_timeout=BUSY_TIMEOUT):
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": busy_timeout,
+        "connect_args": {"timeout": busy_timeout, "check_same_thread": False},
+    }
+
+
+# Aplica os PRAGMAs do perfil em cada conexão nova que a engine abrir
+def tune(engine, profile="wal"):
+    if profile not in PROFILES:
+        raise ValueError(f"invalid SQLite profile: {profile} (use {', '.join(PROFILES)})")
+    pragmas = PROFILES[profile]
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+def create_engine(url, profile="wal", **options):
+    return tune(sqlalchemy.create_engine(url, **{**engine_options(), **options}), profile)
+
+
+# Cada thread é uma requisição: pega uma conexão do pool, grava uma linha e faz commit
+def bench(threads, writes):
+    from sqlalchemy import Column, Integer, String
+    from sqlalchemy.orm import declarative_base, sessionmaker
+
+    Base = declarative_base()
+
+    class Row(Base):
+        __tablename__ = "rows"
+        id = Column(Integer, primary_key=True)
+        payload = Column(String)
+
+    directory = tempfile.mkdtemp()
+    for profile in PROFILES:
+        path = os.path.join(directory, f"{profile}.db")
+        engine = create_engine(f"sqlite:///{path}", profile, pool_size=threads)
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        latencies = []
+
+        def writer():
+            for i in range(writes):
+                start = time.perf_counter()
+                with Session() as session:
+                    session.add(Row(payload=f"message {i}"))
+                    session.commit()
+                latencies.append(time.perf_counter() - start)
+
+        workers = [threading.Thread(target=writer) for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+
+        latencies.sort()
+        total = threads * writes
+        print(f"{profile:<8} {total / elapsed:8.0f} commits/s   "
+              f"p50 {latencies[total // 2] * 1000:6.2f} ms   p99 {latencies[int(total * 0.99)] * 1000:6.2f} ms")
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+          int(sys.argv[2]) if len(sys.argv) > 2 else 250)
@@ -1,130 +1,946 @@
-import sys
-import socket
-import threading
-
-from cv2 import data
-
-
-def server_loop(local_host, local_port, remote_host, remote_port, receive_first):
-    # cria a a conexão, o af diz que vai ser IPV4, e o sock stream diz que será um client tcp
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    try:
-        server.bind((local_host, local_port))
-    except:
-        print("[!!] Failed to listen on % S:% d", (local_host, local_port))
-        print("[!!] Check for other listening sockets or correct ¬ ;permissions.")
-        sys.exit(0)
-
-    print("[!!] Failed  %s:%d" % (local_host, local_port))
-    server.listen(5)
-
-    while True:
-        client_socket, addr = server.accept()
-
-        # print out the local conection info.
-        print("[===>] Received incoming connection from  %s:%d" % addr[0], addr[1])
-        # start a thread --
-        proxy_thread = threading.Thread(target=
-                                        proxy_handler,
-                                        args=(client_socket, remote_host, remote_port, receive_first))
-
-        proxy_thread.start()
-
-
-def main():
-    # no fancy command-line parsing here
-    if len(sys.argv[1:]) != 3:
-        print("usage: ./proxy_tcp.py [localhost] [localport] [remotehost] [remoteport] [receive_first]")
-        print("example: ./proxy_tcp.py 127.0.0.1 9000 10.12.132.1 9000 True")
-        sys.exit(0)
-
-    # setup local liste. par.
-
-    local_host = sys.argv[1]
-    local_port = int(sys.argv[2])
-
-    remote_host = sys.argv[3]
-    remote_port = int(sys.argv[4])
-
-    receive_first = sys.argv[5]
-    if "True" in receive_first:
-        receive_first = True
-    else:
-        receive_first = False
-
-    server_loop(local_host, local_port, remote_host, remote_port, receive_first)
-
-def proxy_handler(client_socket, remote_host, remote_port, receive_first):
-    remote_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    remote_socket.connect((remote_host, remote_port))
-    if receive_first:
-        remote_buffer = receive_from(remote_socket)
-        hexdump(remote_buffer)
-        if len(remote_buffer):
-            print("[<==] Sending %d bytes to localhost. " % len(remote_buffer))
-            client_socket(remote_buffer)
-
-
-    # read from local
-    while True:
-        local_buffer = receive_from(client_socket)
-
-        if len(local_buffer):
-            print("[==>] Received %d bytes from localhost. " % len(local_buffer))
-            hexdump(local_buffer)
-
-            local_buffer = request_handler(local_buffer)
-            remote_socket.send(local_buffer)
-            print("[==>] Sent to remote.")
-
-    # receive back the response
-
-    remote_buffer = receive_from(remote_socket)
-
-    if len(remote_buffer):
-        print("[<==] Received %d bytes from remote. " % len(remote_buffer))
-        hexdump(remote_buffer)
-
-        remote_buffer = request_handler(remote_buffer)
-        client_socket.send(remote_buffer)
-        print("[<==] Sent to remote.")
-
-    if not len(local_buffer) or not len(remote_buffer):
-        client_socket.close()
-        remote_socket.close()
-        print("[*] No more Data, Closing connection.")
-
-# http://code.activestate.com/recipes/142812-hex-dumper/
-def hexdump(src, length=16):
-    result = []
-    digits = 4 if isinstance(src, bytes) else 2
-    for i in range(0, len(src), length):
-        s = src[i:i+length]
-        hexa = b' '.join(["%0*X" % (digits, ord(x)) for x in s])
-        text = b''.join([x if 0x20 <= ord(x) < 0x7F else b'.' for x in s])
-        result.append( b"%04X   %-*s   %s" % (i, length*(digits + 1), hexa,text))
-    print(b'\n'.join(result))
-
-
-def receive_from(connection):
-    buffer = ""
-    connection.settimeout(2)
-
-    try:
-        while True:
-            data = connection.recv(4096)
-            if not data:
-                break
-    except: # fixme -> improve this error handling
-        pass
-    return buffer
-
-def request_handler(buffer):
-    return buffer
-
-def response_handler(buffer):
-    return buffer
-
-
-if __name__ == "__main__":
-    main()
+import os
+import sys
+import time
+import socket
+import json
+import zlib
+import queue
+import signal
+import struct
+import asyncio
+import threading
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+BUFFER_SIZE = 65536
+# print one line per connection and per forwarded chunk; off by default because the
+# prints run synchronously on the event loop (use CAPTURE to see the traffic instead)
+VERBOSE = False
+
+# Linux fast path: socket -> pipe -> socket with os.splice, no copies through Python.
+# Only used while request_handler and response_handler just return their input.
+SPLICE = hasattr(os, "splice")
+PIPE_SIZE = 1024 * 1024
+
+# Optional pool of warm upstream connections, reused across clients.
+# Only safe for request/response protocols where the client reads the whole
+# answer before closing: the remote connection outlives the client.
+POOL = False
+POOL_MIN_IDLE = 2  # connections kept open and ready per remote
+POOL_MAX_IDLE = 16  # extra idle connections above this are closed
+# connections in use per remote; idle ones give their slot back and are
+# capped separately by POOL_MAX_IDLE, so at most 128 + 16 are open
+POOL_MAX_PER_REMOTE = 128
+POOL_IDLE_TIMEOUT = 30  # seconds before an unused connection is closed
+POOL_CHECK_INTERVAL = 5
+
+upstream_pool = None
+
+# Filter chains applied to each direction, in order. Each entry is a Filter
+# subclass (or any callable taking the connection dict); a new instance is
+# created per connection, so filters can keep per-connection state.
+REQUEST_FILTERS = []
+RESPONSE_FILTERS = []
+
+# Capture of everything forwarded, written by a background thread so the
+# event loop never waits on disk or the terminal. CAPTURE is a file path,
+# "-" for a hexdump on stdout, or None; the format follows the extension:
+# .pcapng (opens in Wireshark), .log (compact binary, see read_log) or text hexdump.
+CAPTURE = None
+CAPTURE_QUEUE = 64 * 1024 * 1024  # bytes waiting for the writer; beyond this records are dropped
+
+capture_writer = None
+
+
+class UpstreamPool:
+    def __init__(self, min_idle=POOL_MIN_IDLE, max_idle=POOL_MAX_IDLE,
+                 max_per_remote=POOL_MAX_PER_REMOTE, idle_timeout=POOL_IDLE_TIMEOUT):
+        self.min_idle = min_idle
+        self.max_idle = max_idle
+        self.max_per_remote = max_per_remote
+        self.idle_timeout = idle_timeout
+        self._idle = {}  # (host, port) -> deque of (socket, idle since)
+        self._slots = {}  # (host, port) -> semaphore capping connections in use
+        self._opening = {}  # (host, port) -> warm-up connections being opened
+        self.stats = {"reused": 0, "opened": 0, "discarded": 0}
+
+    def _slot(self, remote):
+        if remote not in self._slots:
+            self._slots[remote] = asyncio.Semaphore(self.max_per_remote)
+            self._idle[remote] = deque()
+            self._opening[remote] = 0
+        return self._slots[remote]
+
+    async def _connect(self, remote):
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, remote)
+        except OSError:
+            sock.close()
+            raise
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stats["opened"] += 1
+        return sock
+
+    # a pooled connection is healthy if the remote did not close it and sent nothing unasked
+    @staticmethod
+    def healthy(sock):
+        try:
+            sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT)
+            # any return is bad news: b"" means the remote closed, data means it spoke unasked
+            return False
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+    async def acquire(self, host, port):
+        remote = (host, port)
+        await self._slot(remote).acquire()
+        idle = self._idle[remote]
+        while idle:
+            sock, _ = idle.pop()  # most recently used first, it is the warmest
+            if self.healthy(sock):
+                self.stats["reused"] += 1
+                self._refill(remote)
+                return sock
+            self.stats["discarded"] += 1
+            sock.close()
+        try:
+            sock = await self._connect(remote)
+        except OSError:
+            self._slots[remote].release()
+            raise
+        self._refill(remote)
+        return sock
+
+    def release(self, host, port, sock, reusable):
+        remote = (host, port)
+        idle = self._idle[remote]
+        if reusable and len(idle) < self.max_idle and self.healthy(sock):
+            idle.append((sock, time.monotonic()))
+        else:
+            self.stats["discarded"] += 1
+            sock.close()
+        self._slots[remote].release()
+
+    # open connections in the background until min_idle are waiting
+    def _refill(self, remote):
+        missing = self.min_idle - len(self._idle[remote]) - self._opening[remote]
+        for _ in range(max(missing, 0)):
+            self._opening[remote] += 1
+            asyncio.get_running_loop().create_task(self._warm(remote))
+
+    async def _warm(self, remote):
+        slot = self._slots[remote]
+        try:
+            if slot.locked():
+                return  # per-remote cap reached, do not open more
+            await slot.acquire()
+            try:
+                sock = await self._connect(remote)
+            except OSError:
+                slot.release()
+                return
+            self.release(remote[0], remote[1], sock, True)
+        finally:
+            self._opening[remote] -= 1
+
+    # periodic health checks and idle timeouts
+    async def maintain(self):
+        while True:
+            await asyncio.sleep(POOL_CHECK_INTERVAL)
+            now = time.monotonic()
+            for remote, idle in self._idle.items():
+                keep = deque()
+                for sock, since in idle:
+                    if now - since < self.idle_timeout and self.healthy(sock):
+                        keep.append((sock, since))
+                    else:
+                        self.stats["discarded"] += 1
+                        sock.close()
+                self._idle[remote] = keep
+                self._refill(remote)
+
+
+# Many listeners on one event loop, from a JSON config file (./proxy_tcp.py routes.json):
+# {
+#     "capture": "session.pcapng",
+#     "routes": [
+#         {"listen": "0.0.0.0:8080", "remote": "10.0.0.5:80", "max_connections": 200, "pool": true},
+#         {"listen": "0.0.0.0:2525", "remote": "10.0.0.7:25", "receive_first": true}
+#     ]
+# }
+# The file is read again on SIGHUP or when it changes on disk. Listeners are
+# opened, closed or repointed to match it; connections already running are
+# left alone. A file with errors is reported and the running routes are kept.
+# "capture" starts the capture the first time it appears, at startup or on a
+# reload; changing or removing it afterwards only takes effect after a restart.
+RELOAD_INTERVAL = 2  # seconds between checks of the config file
+LISTEN_BACKLOG = 128
+# accept() failing (EMFILE/ENFILE when out of descriptors) is retried after a
+# pause that doubles up to the maximum, instead of ending the listener
+ACCEPT_RETRY_DELAY = 0.1
+ACCEPT_RETRY_DELAY_MAX = 2.0
+
+
+class Route:
+    def __init__(self, listen, remote, receive_first=False, max_connections=0, pool=False):
+        self.listen = listen
+        self.remote = remote
+        self.receive_first = receive_first
+        self.max_connections = max_connections  # 0 = no limit
+        self.pool = pool
+
+    def __eq__(self, other):
+        return vars(self) == vars(other)
+
+    def __str__(self):
+        return "%s:%d -> %s:%d" % (self.listen + self.remote)
+
+
+class Listener:
+    def __init__(self, route, server):
+        self.route = route
+        self.server = server
+        self.active = 0  # live connections, counted against route.max_connections
+        self.rejected = 0
+        self.task = None
+
+
+def parse_address(text):
+    host, _, port = str(text).rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError("expected host:port, got %r" % text)
+    return host, int(port)
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    if not isinstance(config, dict):
+        raise ValueError("the top level must be an object")
+    if not isinstance(config.get("routes", []), list):
+        raise ValueError('"routes" must be a list')
+    if not isinstance(config.get("capture"), (str, type(None))):
+        raise ValueError('"capture" must be a file path')
+    routes = {}
+    for entry in config.get("routes", []):
+        if not isinstance(entry, dict):
+            raise ValueError("each route must be an object, got %r" % (entry,))
+        route = Route(parse_address(entry["listen"]), parse_address(entry["remote"]),
+                      bool(entry.get("receive_first", False)), int(entry.get("max_connections", 0)),
+                      bool(entry.get("pool", False)))
+        if route.listen in routes:
+            raise ValueError("%s:%d is listed twice" % route.listen)
+        routes[route.listen] = route
+    return config, routes
+
+
+def server_loop(local_host, local_port, remote_host, remote_port, receive_first):
+    run(serve(local_host, local_port, remote_host, remote_port, receive_first))
+
+
+def config_loop(path):
+    run(serve_config(path))
+
+
+def run(coroutine):
+    try:
+        asyncio.run(coroutine)
+    except KeyboardInterrupt:
+        print("\n[*] Proxy stopped.")
+    finally:
+        if capture_writer is not None:
+            capture_writer.close()
+            if capture_writer.dropped:
+                print("[!!] %d capture records dropped" % capture_writer.dropped)
+
+
+def start_capture(path):
+    global capture_writer
+    if path and capture_writer is None:
+        capture_writer = CaptureWriter(path)
+        capture_writer.start()
+
+
+def get_pool():
+    global upstream_pool
+    if upstream_pool is None:
+        upstream_pool = UpstreamPool()
+        asyncio.get_running_loop().create_task(upstream_pool.maintain())
+    return upstream_pool
+
+
+def open_listener(route):
+    # cria a a conexão, o af diz que vai ser IPV4, e o sock stream diz que será um client tcp
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    try:
+        server.bind(route.listen)
+    except OSError:
+        server.close()
+        print("[!!] Failed to listen on %s:%d" % route.listen)
+        print("[!!] Check for other listening sockets or correct permissions.")
+        return None
+
+    print("[*] Listening on %s:%d" % route.listen)
+    server.listen(LISTEN_BACKLOG)
+    server.setblocking(False)
+    listener = Listener(route, server)
+    listener.task = asyncio.get_running_loop().create_task(accept_loop(listener))
+    return listener
+
+
+def close_listener(listener):
+    listener.task.cancel()
+    listener.server.close()
+    print("[*] Stopped listening on %s:%d (%d connections still open)" % (listener.route.listen + (listener.active,)))
+
+
+async def accept_loop(listener):
+    loop = asyncio.get_running_loop()
+    delay = ACCEPT_RETRY_DELAY
+    while True:
+        try:
+            client_socket, addr = await loop.sock_accept(listener.server)
+        except OSError as e:
+            print("[!!] accept failed on %s:%d, retrying in %.1fs: %s" % (listener.route.listen + (delay, e)))
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, ACCEPT_RETRY_DELAY_MAX)
+            continue
+        delay = ACCEPT_RETRY_DELAY
+        # read on every accept, so a reload applies to the next connection
+        route = listener.route
+
+        if route.max_connections and listener.active >= route.max_connections:
+            listener.rejected += 1
+            client_socket.close()
+            if VERBOSE:
+                print("[!!] %s: limit of %d connections reached, refused %s:%d"
+                      % (route, route.max_connections, addr[0], addr[1]))
+            continue
+
+        # print out the local conection info.
+        if VERBOSE:
+            print("[===>] Received incoming connection from %s:%d" % (addr[0], addr[1]))
+        # one task per connection instead of one thread
+        listener.active += 1
+        task = loop.create_task(proxy_handler(client_socket, route.remote[0], route.remote[1],
+                                              route.receive_first, get_pool() if route.pool else None))
+        task.add_done_callback(lambda _, listener=listener: setattr(listener, "active", listener.active - 1))
+
+
+async def serve(local_host, local_port, remote_host, remote_port, receive_first):
+    start_capture(CAPTURE)
+    listener = open_listener(Route((local_host, local_port), (remote_host, remote_port), receive_first, pool=POOL))
+    if listener is None:
+        sys.exit(0)
+    await listener.task
+
+
+class ConfigProxy:
+    def __init__(self, path):
+        self.path = path
+        self.listeners = {}  # (host, port) -> Listener
+        self.mtime = None
+
+    def reload(self):
+        try:
+            self.mtime = os.stat(self.path).st_mtime
+            config, routes = load_config(self.path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print("[!!] Could not load %s, keeping the current routes: %s" % (self.path, e))
+            return
+        start_capture(config.get("capture"))
+
+        for listen in list(self.listeners):
+            if listen not in routes:
+                close_listener(self.listeners.pop(listen))
+        for listen, route in routes.items():
+            listener = self.listeners.get(listen)
+            if listener is None:
+                listener = open_listener(route)
+                if listener is not None:
+                    self.listeners[listen] = listener
+            elif listener.route != route:
+                print("[*] Route updated: %s, max_connections %d, pool %s"
+                      % (route, route.max_connections, route.pool))
+                listener.route = route
+        print("[*] %d routes loaded from %s" % (len(self.listeners), self.path))
+
+    async def watch(self):
+        while True:
+            await asyncio.sleep(RELOAD_INTERVAL)
+            try:
+                mtime = os.stat(self.path).st_mtime
+            except OSError:
+                continue
+            if mtime != self.mtime:
+                self.reload()
+
+
+async def serve_config(path):
+    proxy = ConfigProxy(path)
+    proxy.reload()
+    loop = asyncio.get_running_loop()
+    if hasattr(signal, "SIGHUP"):
+        loop.add_signal_handler(signal.SIGHUP, proxy.reload)
+    await proxy.watch()
+
+
+def main():
+    # no fancy command-line parsing here
+    if len(sys.argv[1:]) == 1:
+        config_loop(sys.argv[1])
+        return
+
+    options = sys.argv[6:]
+    if len(sys.argv[1:]) < 5 or any(o != "pool" and not o.startswith("capture=") for o in options):
+        print("usage: ./proxy_tcp.py [localhost] [localport] [remotehost] [remoteport] [receive_first] "
+              "[pool] [capture=FILE]")
+        print("       ./proxy_tcp.py [config.json]")
+        print("example: ./proxy_tcp.py 127.0.0.1 9000 10.12.132.1 9000 True")
+        print("example: ./proxy_tcp.py 127.0.0.1 9000 10.12.132.1 9000 False pool")
+        print("example: ./proxy_tcp.py 127.0.0.1 9000 10.12.132.1 9000 True capture=session.pcapng")
+        print("example: ./proxy_tcp.py 127.0.0.1 9000 10.12.132.1 9000 True capture=-")
+        sys.exit(0)
+
+    global POOL, CAPTURE
+    POOL = "pool" in options
+    for option in options:
+        if option.startswith("capture="):
+            CAPTURE = option[len("capture="):]
+
+    # setup local liste. par.
+
+    local_host = sys.argv[1]
+    local_port = int(sys.argv[2])
+
+    remote_host = sys.argv[3]
+    remote_port = int(sys.argv[4])
+
+    receive_first = sys.argv[5]
+    if "True" in receive_first:
+        receive_first = True
+    else:
+        receive_first = False
+
+    server_loop(local_host, local_port, remote_host, remote_port, receive_first)
+
+
+async def proxy_handler(client_socket, remote_host, remote_port, receive_first, pool=None):
+    # both directions are relayed at the same time, so receive_first needs no
+    # special handling: a banner from the remote is forwarded as soon as it arrives
+    loop = asyncio.get_running_loop()
+    client_socket.setblocking(False)
+    client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    pooled = pool is not None
+    try:
+        if pooled:
+            remote_socket = await pool.acquire(remote_host, remote_port)
+        else:
+            remote_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            remote_socket.setblocking(False)
+            try:
+                await loop.sock_connect(remote_socket, (remote_host, remote_port))
+            except OSError:
+                remote_socket.close()
+                raise
+            remote_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError as e:
+        print("[!!] Could not connect to %s:%d: %s" % (remote_host, remote_port, e))
+        client_socket.close()
+        return
+
+    connection = {"client": client_socket.getpeername(), "remote": remote_socket.getpeername()}
+    request_chain = build_chain(REQUEST_FILTERS, request_handler, connection)
+    response_chain = build_chain(RESPONSE_FILTERS, response_handler, connection)
+    if capture_writer is not None:
+        # last stage, so the capture shows the bytes as they go on the wire
+        connection["id"] = capture_writer.open(connection["client"], connection["remote"])
+        request_chain.append(Capture(connection, REQUEST))
+        response_chain.append(Capture(connection, RESPONSE))
+
+    # with a pool the client's FIN ends the session instead of being passed to the remote
+    if SPLICE and not request_chain and not response_chain:
+        upstream = splice_relay(client_socket, remote_socket, "[==>] %d bytes localhost -> remote.",
+                                half_close=not pooled)
+        downstream = splice_relay(remote_socket, client_socket, "[<==] %d bytes remote -> localhost.")
+    else:
+        upstream = relay(client_socket, remote_socket, request_chain,
+                         "[==>] %d bytes localhost -> remote.", half_close=not pooled)
+        downstream = relay(remote_socket, client_socket, response_chain,
+                           "[<==] %d bytes remote -> localhost.")
+    tasks = [loop.create_task(upstream), loop.create_task(downstream)]
+    reusable = False
+    try:
+        if pooled:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            # reusable only if the client finished cleanly and the remote is still open
+            reusable = tasks[0] in done and tasks[0].exception() is None and not tasks[1].done()
+        else:
+            await asyncio.gather(*tasks)
+    except OSError as e:
+        print("[!!] Connection error: %s" % e)
+    finally:
+        # stop the other direction before closing the sockets under it
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # a cancelled or failed relay never reached flush_chain: close its capture here
+        for stage in request_chain + response_chain:
+            if isinstance(stage, Capture):
+                stage.flush()
+        client_socket.close()
+        if pooled:
+            pool.release(remote_host, remote_port, remote_socket, reusable)
+        else:
+            remote_socket.close()
+        if VERBOSE:
+            print("[*] No more Data, Closing connection.")
+
+
+# move bytes from src to dst as soon as they arrive, until src sends FIN
+async def relay(src, dst, chain, message, half_close=True):
+    loop = asyncio.get_running_loop()
+    buffer = bytearray(BUFFER_SIZE)
+    view = memoryview(buffer)
+    while True:
+        try:
+            received = await loop.sock_recv_into(src, buffer)
+        except ConnectionResetError:
+            received = 0
+        if not received:
+            break
+        if VERBOSE:
+            print(message % received)
+        out = run_chain(chain, view[:received])
+        if out:
+            await loop.sock_sendall(dst, out)
+
+    out = flush_chain(chain)
+    if out:
+        await loop.sock_sendall(dst, out)
+
+    # half-close: tell the other side this direction is done but keep reading the other one
+    if half_close:
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+async def wait_fd(sock, writable=False):
+    loop = asyncio.get_running_loop()
+    ready = loop.create_future()
+    fd = sock.fileno()
+    if writable:
+        loop.add_writer(fd, ready.set_result, None)
+    else:
+        loop.add_reader(fd, ready.set_result, None)
+    try:
+        await ready
+    finally:
+        if writable:
+            loop.remove_writer(fd)
+        else:
+            loop.remove_reader(fd)
+
+
+# same as relay() but the bytes never leave the kernel
+async def splice_relay(src, dst, message, half_close=True):
+    pipe_read, pipe_write = os.pipe()
+    os.set_blocking(pipe_read, False)
+    os.set_blocking(pipe_write, False)
+    if fcntl is not None and hasattr(fcntl, "F_SETPIPE_SZ"):
+        try:
+            fcntl.fcntl(pipe_write, fcntl.F_SETPIPE_SZ, PIPE_SIZE)
+        except OSError:
+            pass  # above /proc/sys/fs/pipe-max-size, keep the default 64 KB
+    flags = os.SPLICE_F_MOVE | os.SPLICE_F_NONBLOCK
+    in_pipe = 0
+    try:
+        while True:
+            if not in_pipe:
+                try:
+                    in_pipe = os.splice(src.fileno(), pipe_write, PIPE_SIZE, flags=flags)
+                except BlockingIOError:
+                    await wait_fd(src)
+                    continue
+                except ConnectionResetError:
+                    in_pipe = 0
+                if not in_pipe:
+                    break
+                if VERBOSE:
+                    print(message % in_pipe)
+            try:
+                in_pipe -= os.splice(pipe_read, dst.fileno(), in_pipe, flags=flags)
+            except BlockingIOError:
+                await wait_fd(dst, writable=True)
+    finally:
+        os.close(pipe_read)
+        os.close(pipe_write)
+
+    if half_close:
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+# the stock handlers below are "return buffer"; anything else needs to see the bytes
+def is_identity(handler):
+    code = getattr(handler, "__code__", None)
+    return (code is not None and code.co_argcount == 1
+            and code.co_code == _identity.__code__.co_code)
+
+
+def _identity(buffer):
+    return buffer
+
+
+class Filter:
+    """One stage of a streaming filter chain.
+
+    feed() gets each chunk as a memoryview over the relay buffer and returns
+    the bytes to pass on (the view itself, a slice of it, new bytes, or b""
+    to hold everything back). The buffer is reused for the next read, so a
+    filter that keeps data between calls must copy it (bytes(chunk)).
+    flush() is called once at EOF and returns whatever is still held back.
+    The connection dict is shared by both directions of one connection.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def feed(self, chunk):
+        return chunk
+
+    def flush(self):
+        return b""
+
+
+class ByteCounter(Filter):
+    # metrics only: counts chunks and bytes in connection["stats"][direction]
+    def __init__(self, connection, direction="bytes"):
+        super().__init__(connection)
+        self.stats = connection.setdefault("stats", {}).setdefault(direction, [0, 0])
+
+    def feed(self, chunk):
+        self.stats[0] += 1
+        self.stats[1] += len(chunk)
+        return chunk
+
+
+class Replace(Filter):
+    # rewrites old -> new even when old is split between two chunks,
+    # holding back at most len(old) - 1 bytes
+    old = b""
+    new = b""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.tail = b""
+
+    def feed(self, chunk):
+        if not self.old:
+            return chunk
+        data = self.tail + bytes(chunk)
+        # matches are complete up to the last one found; after it, the last
+        # len(old) - 1 bytes could still be the start of one split by the next chunk
+        last = data.rfind(self.old)
+        cut = max(last + len(self.old) if last != -1 else 0, len(data) - len(self.old) + 1)
+        self.tail = data[cut:]
+        return data[:cut].replace(self.old, self.new)
+
+    def flush(self):
+        tail, self.tail = self.tail, b""
+        return tail
+
+
+class Deflate(Filter):
+    # compresses the stream; Z_SYNC_FLUSH per chunk keeps it interactive,
+    # the other end reads it with zlib.decompressobj()
+    level = 1
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.compressor = zlib.compressobj(self.level)
+
+    def feed(self, chunk):
+        return self.compressor.compress(chunk) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def flush(self):
+        return self.compressor.flush()
+
+
+class Inflate(Filter):
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.decompressor = zlib.decompressobj()
+
+    def feed(self, chunk):
+        return self.decompressor.decompress(chunk)
+
+    def flush(self):
+        return self.decompressor.flush()
+
+
+class HandlerFilter(Filter):
+    # adapts the old request_handler/response_handler functions (bytes in, bytes out)
+    handler = None
+
+    def feed(self, chunk):
+        return type(self).handler(bytes(chunk))
+
+
+def handler_filter(handler):
+    return type("HandlerFilter", (HandlerFilter,), {"handler": staticmethod(handler)})
+
+
+def build_chain(filters, handler, connection):
+    if not is_identity(handler):
+        filters = list(filters) + [handler_filter(handler)]
+    return [factory(connection) for factory in filters]
+
+
+def run_chain(chain, chunk):
+    for stage in chain:
+        chunk = stage.feed(chunk)
+        if not chunk:
+            return b""
+    return chunk
+
+
+# at EOF each stage's leftovers still go through the stages after it
+def flush_chain(chain):
+    out = b""
+    for stage in chain:
+        if out:
+            out = stage.feed(memoryview(out))
+        out = bytes(out) + bytes(stage.flush())
+    return out
+
+
+_PRINTABLE = bytes(c if 0x20 <= c < 0x7F else ord(".") for c in range(256))
+
+
+# one bytes.hex() and one bytes.translate() for the whole buffer, then sliced
+# per line, instead of a formatted Python string per byte
+def hexdump(src, length=16):
+    src = bytes(src)
+    hexa = src.hex(" ").upper()
+    text = src.translate(_PRINTABLE).decode("ascii")
+    width = length * 3 - 1
+    return "\n".join(["%04X   %-*s   %s" % (i, width, hexa[i * 3:i * 3 + width], text[i:i + length])
+                      for i in range(0, len(src), length)])
+
+
+# capture record kinds
+OPEN = 0
+REQUEST = 1  # client -> remote
+RESPONSE = 2  # remote -> client
+CLOSE = 3
+
+LOG_MAGIC = b"PXYLOG1\n"
+LOG_RECORD = struct.Struct("<dIBI")  # timestamp, connection id, kind, length; then the data
+
+
+class Capture(Filter):
+    # hands a copy of each chunk to the writer thread and forwards the chunk untouched
+    def __init__(self, connection, kind):
+        super().__init__(connection)
+        self.kind = kind
+        self.closed = False
+
+    def feed(self, chunk):
+        capture_writer.record(self.connection["id"], self.kind, bytes(chunk))
+        return chunk
+
+    # at EOF, or from proxy_handler when the relay was cancelled before it:
+    # the writer drops the connection's state after both directions are closed
+    def flush(self):
+        if not self.closed:
+            self.closed = True
+            capture_writer.record(self.connection["id"], CLOSE, bytes([self.kind]))
+        return b""
+
+
+class CaptureWriter(threading.Thread):
+    def __init__(self, path, max_queue=CAPTURE_QUEUE):
+        super().__init__(daemon=True)
+        self.path = path
+        if path == "-":
+            self.format = "hex"
+        else:
+            self.format = {".pcapng": "pcapng", ".log": "log"}.get(os.path.splitext(path)[1], "hex")
+        self.queue = queue.SimpleQueue()
+        self.max_queue = max_queue
+        self.queued = 0  # bytes in the queue
+        self.queued_lock = threading.Lock()
+        self.dropped = 0
+        self.connections = 0
+        # pcapng: addresses and next sequence number of each direction
+        self.peers = {}
+
+    # called on the event loop: never blocks, drops the record if the writer is behind
+    def record(self, connection_id, kind, data):
+        with self.queued_lock:
+            if self.queued + len(data) > self.max_queue:
+                self.dropped += 1
+                return
+            self.queued += len(data)
+        self.queue.put((time.time(), connection_id, kind, data))
+
+    def open(self, client, remote):
+        self.connections += 1
+        self.record(self.connections, OPEN, ("%s:%d %s:%d" % (client[:2] + remote[:2])).encode())
+        return self.connections
+
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        if self.path == "-":
+            out = sys.stdout.buffer
+        else:
+            out = open(self.path, "wb")
+        write = {"pcapng": self._pcapng, "log": self._log, "hex": self._hex}[self.format]
+        if self.format == "pcapng":
+            out.write(_pcapng_header())
+        elif self.format == "log":
+            out.write(LOG_MAGIC)
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                write(out, *item)
+                with self.queued_lock:
+                    self.queued -= len(item[3])
+                # write whatever else is already waiting before flushing
+                if self.queue.empty():
+                    out.flush()
+        finally:
+            out.flush()
+            if out is not sys.stdout.buffer:
+                out.close()
+
+    def _log(self, out, timestamp, connection_id, kind, data):
+        out.write(LOG_RECORD.pack(timestamp, connection_id, kind, len(data)))
+        out.write(data)
+
+    def _hex(self, out, timestamp, connection_id, kind, data):
+        if kind == OPEN:
+            text = "[%d] open %s" % (connection_id, data.decode())
+        elif kind == CLOSE:
+            text = "[%d] %s closed" % (connection_id, "client" if data[0] == REQUEST else "remote")
+        else:
+            arrow = "==>" if kind == REQUEST else "<=="
+            text = "[%d] [%s] %d bytes\n%s" % (connection_id, arrow, len(data), hexdump(data))
+        out.write(text.encode() + b"\n")
+
+    # each chunk becomes a TCP segment in a raw IPv4 packet, with sequence
+    # numbers kept per direction, so Wireshark can follow the stream
+    def _pcapng(self, out, timestamp, connection_id, kind, data):
+        if kind == OPEN:
+            client, remote = data.decode().split()
+            self.peers[connection_id] = {REQUEST: [_endpoint(client), _endpoint(remote), 1],
+                                         RESPONSE: [_endpoint(remote), _endpoint(client), 1],
+                                         CLOSE: 0}
+            return
+        peers = self.peers.get(connection_id)
+        if peers is None:
+            return
+        if kind == CLOSE:
+            direction = peers[data[0]]
+            out.write(_pcapng_packet(timestamp, direction, peers, data[0], b"", fin=True))
+            direction[2] += 1
+            peers[CLOSE] += 1
+            if peers[CLOSE] == 2:
+                del self.peers[connection_id]
+            return
+        direction = peers[kind]
+        for i in range(0, len(data), PCAP_MAX_SEGMENT):
+            segment = data[i:i + PCAP_MAX_SEGMENT]
+            out.write(_pcapng_packet(timestamp, direction, peers, kind, segment))
+            direction[2] = (direction[2] + len(segment)) & 0xFFFFFFFF
+
+
+PCAP_MAX_SEGMENT = 65535 - 40  # what fits in one IPv4 packet
+LINKTYPE_RAW = 101
+_IP_HEADER = struct.Struct("!BBHHHBBH4s4s")
+_TCP_HEADER = struct.Struct("!HHIIBBHHH")
+
+
+def _endpoint(text):
+    host, port = text.rsplit(":", 1)
+    try:
+        address = socket.inet_aton(host)
+    except OSError:  # IPv6 peers are recorded as 0.0.0.0
+        address = bytes(4)
+    return address, int(port)
+
+
+def _pcapng_block(block_type, body):
+    body += bytes(-len(body) % 4)
+    length = len(body) + 12
+    return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+
+def _pcapng_header():
+    section = _pcapng_block(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1))
+    interface = _pcapng_block(1, struct.pack("<HHI", LINKTYPE_RAW, 0, 0))
+    return section + interface
+
+
+def _ip_checksum(header):
+    total = sum(struct.unpack("!10H", header))
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+def _pcapng_packet(timestamp, direction, peers, kind, payload, fin=False):
+    (src, src_port), (dst, dst_port), seq = direction
+    ack = peers[RESPONSE if kind == REQUEST else REQUEST][2]
+    flags = 0x11 if fin else 0x18  # FIN|ACK or PSH|ACK
+    tcp = _TCP_HEADER.pack(src_port, dst_port, seq, ack, 5 << 4, flags, 65535, 0, 0)
+    ip = _IP_HEADER.pack(0x45, 0, 40 + len(payload), 0, 0, 64, socket.IPPROTO_TCP, 0, src, dst)
+    ip = ip[:10] + struct.pack("!H", _ip_checksum(ip)) + ip[12:]
+    packet = ip + tcp + payload
+    micros = int(timestamp * 1e6)
+    body = struct.pack("<IIIII", 0, micros >> 32, micros & 0xFFFFFFFF, len(packet), len(packet)) + packet
+    return _pcapng_block(6, body)
+
+
+# reads a .log capture back: yields (timestamp, connection id, kind, data)
+def read_log(path):
+    with open(path, "rb") as f:
+        if f.read(len(LOG_MAGIC)) != LOG_MAGIC:
+            raise ValueError("%s is not a proxy_tcp capture log" % path)
+        while True:
+            header = f.read(LOG_RECORD.size)
+            if len(header) < LOG_RECORD.size:
+                break
+            timestamp, connection_id, kind, length = LOG_RECORD.unpack(header)
+            yield timestamp, connection_id, kind, f.read(length)
+
+
+def request_handler(buffer):
+    return buffer
+
+def response_handler(buffer):
+    return buffer
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+import os
+import sys
+import time
+import tempfile
+import socket
+import threading
+from multiprocessing import Process
+
+import proxy_tcp
+
+# compares a direct connection to the backend against one through proxy_tcp
+# usage: python proxy_tcp_bench.py [megabytes] [round_trips] [connections]
+
+HOST = "127.0.0.1"
+BACKEND_PORT = 9901
+PROXY_PORT = 9900
+POOLED_PROXY_PORT = 9902
+FILTERED_PROXY_PORT = 9903
+CAPTURED_PROXY_PORT = 9904
+CHUNK = 65536
+
+
+# first byte picks the mode: b"E" echoes everything back (mode byte included),
+# b"S" discards and answers b"ok" on EOF
+def backend_connection(conn):
+    mode = conn.recv(1)
+    if mode == b"E":
+        conn.sendall(mode)
+        while True:
+            data = conn.recv(CHUNK)
+            if not data:
+                break
+            conn.sendall(data)
+    elif mode == b"S":
+        while conn.recv(CHUNK):
+            pass
+        conn.sendall(b"ok")
+    conn.close()
+
+
+def backend():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((HOST, BACKEND_PORT))
+    server.listen(128)
+    while True:
+        conn, _ = server.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=backend_connection, args=(conn,), daemon=True).start()
+
+
+class BenchReplace(proxy_tcp.Replace):
+    old = b"Host: localhost"
+    new = b"Host: backend.internal"
+
+
+# each stage alone, and all of them chained
+STAGES = [
+    ("ByteCounter", [proxy_tcp.ByteCounter]),
+    ("Replace", [BenchReplace]),
+    ("Deflate", [proxy_tcp.Deflate]),
+    ("handler", [proxy_tcp.handler_filter(lambda buffer: buffer)]),
+    ("all", [proxy_tcp.ByteCounter, BenchReplace, proxy_tcp.Deflate]),
+]
+
+
+def proxy(port=PROXY_PORT, pool=False, request_filters=(), capture=None):
+    proxy_tcp.VERBOSE = False
+    proxy_tcp.POOL = pool
+    proxy_tcp.REQUEST_FILTERS = list(request_filters)
+    proxy_tcp.CAPTURE = capture
+    proxy_tcp.server_loop(HOST, port, HOST, BACKEND_PORT, False)
+
+
+def recv_exactly(sock, size):
+    received = 0
+    while received < size:
+        chunk = sock.recv(CHUNK)
+        if not chunk:
+            raise ConnectionError("connection closed")
+        received += len(chunk)
+
+
+def connect(port, mode):
+    sock = socket.create_connection((HOST, port))
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.sendall(mode)
+    if mode == b"E":
+        recv_exactly(sock, 1)
+    return sock
+
+
+def throughput(port, megabytes):
+    payload = b"x" * CHUNK
+    total = megabytes * 1024 * 1024
+    sock = connect(port, b"S")
+    start = time.perf_counter()
+    sent = 0
+    while sent < total:
+        sock.sendall(payload)
+        sent += len(payload)
+    sock.shutdown(socket.SHUT_WR)  # the proxy must forward the half-close
+    assert sock.recv(2) == b"ok"
+    elapsed = time.perf_counter() - start
+    sock.close()
+    return sent * 8 / elapsed / 1e9
+
+
+def latency(port, round_trips):
+    sock = connect(port, b"E")
+    message = b"p" * 64
+    samples = []
+    for _ in range(round_trips):
+        start = time.perf_counter()
+        sock.sendall(message)
+        recv_exactly(sock, len(message))
+        samples.append(time.perf_counter() - start)
+    sock.close()
+    return percentiles(samples)
+
+
+# a short-lived client: connect, one 64 byte round trip, close
+# through a pooled proxy the backend connection is reused, so the echo
+# connection may already be in echo mode and sends the mode byte back too
+def connection_setup(port, connections):
+    message = b"E" + b"p" * 64
+    samples = []
+    for _ in range(connections):
+        start = time.perf_counter()
+        sock = socket.create_connection((HOST, port))
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.sendall(message)
+        recv_exactly(sock, len(message))
+        samples.append(time.perf_counter() - start)
+        sock.close()
+    return percentiles(samples)
+
+
+def percentiles(samples):
+    samples.sort()
+    return samples[len(samples) // 2] * 1e6, samples[int(len(samples) * 0.99)] * 1e6
+
+
+# user + system CPU seconds of a process (Linux only, None elsewhere)
+def cpu_seconds(pid):
+    try:
+        with open("/proc/%d/stat" % pid) as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def report(name, port, megabytes, round_trips, pid=None):
+    cpu_before = cpu_seconds(pid) if pid else None
+    gbits = throughput(port, megabytes)
+    cpu_after = cpu_seconds(pid) if pid else None
+    p50, p99 = latency(port, round_trips)
+    line = "%-8s %8.2f Gbit/s   rtt p50 %7.1f us   p99 %7.1f us" % (name, gbits, p50, p99)
+    if cpu_before is not None and cpu_after is not None:
+        line += "   proxy cpu %.2f s/GB" % ((cpu_after - cpu_before) / (megabytes / 1024))
+    print(line)
+    return p50
+
+
+# in-process cost of each filter stage on CHUNK sized memoryviews of HTTP-like text
+def filter_overhead(megabytes):
+    line = b"GET /index.html HTTP/1.1\r\nHost: localhost\r\nAccept: */*\r\n\r\n"
+    buffer = bytearray((line * (CHUNK // len(line) + 1))[:CHUNK])
+    view = memoryview(buffer)
+    chunks = megabytes * 1024 * 1024 // CHUNK
+    for name, filters in STAGES:
+        chain = [factory({}) for factory in filters]
+        start = time.perf_counter()
+        for _ in range(chunks):
+            proxy_tcp.run_chain(chain, view)
+        proxy_tcp.flush_chain(chain)
+        elapsed = time.perf_counter() - start
+        print("%-12s %7.1f us/chunk   %8.0f MB/s" % (name, elapsed / chunks * 1e6, megabytes / elapsed))
+
+
+# the original recipe, one formatted string per byte (made to run on Python 3 bytes)
+def hexdump_per_byte(src, length=16):
+    result = []
+    for i in range(0, len(src), length):
+        s = src[i:i + length]
+        hexa = " ".join(["%02X" % x for x in s])
+        text = "".join([chr(x) if 0x20 <= x < 0x7F else "." for x in s])
+        result.append("%04X   %-*s   %s" % (i, length * 3 - 1, hexa, text))
+    return "\n".join(result)
+
+
+def hexdump_speed(kilobytes=4096):
+    data = os.urandom(kilobytes * 1024)
+    for name, function in (("per byte", hexdump_per_byte), ("hexdump", proxy_tcp.hexdump)):
+        start = time.perf_counter()
+        function(data)
+        elapsed = time.perf_counter() - start
+        print("%-12s %8.1f MB/s" % (name, kilobytes / 1024 / elapsed))
+
+
+def report_setup(name, port, connections):
+    p50, p99 = connection_setup(port, connections)
+    print("%-8s connect + 1 round trip: p50 %7.1f us   p99 %7.1f us" % (name, p50, p99))
+
+
+def main():
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    round_trips = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    connections = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    capture = os.path.join(tempfile.mkdtemp(), "bench.pcapng")
+
+    processes = [
+        Process(target=backend, daemon=True),
+        Process(target=proxy, daemon=True),
+        Process(target=proxy, args=(POOLED_PROXY_PORT, True), daemon=True),
+        Process(target=proxy, args=(FILTERED_PROXY_PORT, False, [proxy_tcp.ByteCounter]), daemon=True),
+        Process(target=proxy, args=(CAPTURED_PROXY_PORT, False, (), capture), daemon=True),
+    ]
+    for process in processes:
+        process.start()
+    time.sleep(0.5)
+
+    try:
+        direct = report("direct", BACKEND_PORT, megabytes, round_trips)
+        proxied = report("proxy", PROXY_PORT, megabytes, round_trips, processes[1].pid)
+        print("added latency (p50): %.1f us" % (proxied - direct))
+        filtered = report("filtered", FILTERED_PROXY_PORT, megabytes, round_trips, processes[3].pid)
+        print("ByteCounter chain instead of splice (p50): %+.1f us" % (filtered - proxied))
+        report("captured", CAPTURED_PROXY_PORT, megabytes, round_trips, processes[4].pid)
+        print("pcapng written in the background: %.0f MB" % (os.path.getsize(capture) / 2 ** 20))
+        print()
+        filter_overhead(megabytes)
+        print()
+        hexdump_speed()
+        print()
+        report_setup("direct", BACKEND_PORT, connections)
+        report_setup("proxy", PROXY_PORT, connections)
+        report_setup("pooled", POOLED_PROXY_PORT, connections)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+        if os.path.exists(capture):
+            os.remove(capture)
+        os.rmdir(os.path.dirname(capture))
+
+
+if __name__ == "__main__":
+    main()
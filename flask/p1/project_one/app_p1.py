@@ -1,23 +1,76 @@
 # app_p2.py
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import click
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, abort, session
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import FlaskForm
+from flask_wtf.csrf import generate_csrf
+from markupsafe import Markup
+from sqlalchemy import delete, insert, not_, select, update
 from wtforms import StringField, SubmitField
 from wtforms.validators import DataRequired
 
-app = Flask(__name__)
+import sqlite_engine
+
+app = Flask(__name__, template_folder='../templates', static_folder='../static')
 app.config['SECRET_KEY'] = 'your_secret_key'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///tasks.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine.engine_options()
+app.config['SQLITE_PROFILE'] = os.environ.get('TASKS_DB_PROFILE', 'wal')  # default, wal or durable
 
 db = SQLAlchemy(app)
+with app.app_context():
+    sqlite_engine.tune(db.engine, app.config['SQLITE_PROFILE'])
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_BULK_IDS = 10000  # Stays under SQLite's limit of bound parameters per statement
+
+# Filtered views: name -> value of Task.completed (None = no filter)
+VIEWS = {'all': None, 'active': False, 'completed': True}
+
+MAX_CACHED_FRAGMENTS = 256
+CSRF_TIME_LIMIT = app.config.get('WTF_CSRF_TIME_LIMIT', 3600)
+
+# Rendered task lists are cached per page and stay valid while the version in
+# the task_version table doesn't change (see TaskVersion)
+fragments = OrderedDict()  # (view, limit, after, before) -> (version, html, etag)
+fragment_stats = {'hit': 0, 'miss': 0, 'not_modified': 0}
+# The app runs on Flask's threaded server: the cache and its stats only change
+# under this lock (rendering happens outside it)
+fragments_lock = threading.Lock()
 
 
 # Model
 class Task(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(100), nullable=False)
-    completed = db.Column(db.Boolean, default=False)
+    # SQLite keeps the rowid in every index entry, so (completed, id) is already
+    # ordered and a filtered page is a range scan
+    completed = db.Column(db.Boolean, default=False, index=True)
+
+
+# One row, bumped in the same transaction as every write to the task table. It
+# lives in the database so writes from other processes (flask seed, a second
+# server) invalidate this process's cache too; reading it is a primary key lookup
+class TaskVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+# Call before committing a write to the task table
+def bump_version():
+    db.session.execute(update(TaskVersion).values(version=TaskVersion.version + 1))
+
+
+def current_version():
+    return db.session.execute(select(TaskVersion.version)).scalar_one_or_none() or 0
 
 
 # Form
@@ -26,11 +79,100 @@ class TaskForm(FlaskForm):
     submit = SubmitField('Add Task')
 
 
+def init_db():
+    db.create_all()
+    # create_all() skips tables that already exist, so add the indexes to old databases
+    for index in Task.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+    if db.session.get(TaskVersion, 1) is None:
+        db.session.add(TaskVersion(id=1))
+        db.session.commit()
+
+
+# Keyset pagination: ?after=<id> for the next page, ?before=<id> for the previous one.
+# Each page is one indexed range query, no OFFSET and no COUNT(*)
+def render_tasks(view, limit, after, before):
+    query = Task.query
+    if VIEWS[view] is not None:
+        query = query.filter(Task.completed == VIEWS[view])
+    if before is not None:
+        tasks = query.filter(Task.id < before).order_by(Task.id.desc()).limit(limit + 1).all()
+        has_prev = len(tasks) > limit
+        tasks = tasks[:limit][::-1]
+        has_next = bool(tasks)
+    else:
+        if after is not None:
+            query = query.filter(Task.id > after)
+        tasks = query.order_by(Task.id).limit(limit + 1).all()
+        has_next = len(tasks) > limit
+        tasks = tasks[:limit]
+        has_prev = after is not None and bool(tasks)
+
+    return render_template('_tasks.html', tasks=tasks, view=view, limit=limit,
+                           next_after=tasks[-1].id if has_next else None,
+                           prev_before=tasks[0].id if has_prev else None)
+
+
+# The cached task list while the task version is unchanged, rendered again otherwise
+def tasks_fragment(view, limit, after, before):
+    key = (view, limit, after, before)
+    # Read in the same transaction as the render below, so the two see the same snapshot
+    version = current_version()
+    with fragments_lock:
+        entry = fragments.get(key)
+        if entry is not None and entry[0] == version:
+            fragment_stats['hit'] += 1
+            fragments.move_to_end(key)
+            return entry
+        fragment_stats['miss'] += 1
+    html = render_tasks(view, limit, after, before)
+    entry = (version, html, hashlib.blake2b(html.encode(), digest_size=12).hexdigest())
+    with fragments_lock:
+        fragments[key] = entry
+        fragments.move_to_end(key)
+        while len(fragments) > MAX_CACHED_FRAGMENTS:
+            fragments.popitem(last=False)
+    return entry
+
+
+# The page also carries this session's CSRF token, so the ETag covers the session and
+# changes every half token lifetime: a 304 never hands back an expired token
+def page_etag(fragment_etag):
+    window = int(time.time() // (CSRF_TIME_LIMIT / 2)) if CSRF_TIME_LIMIT else 0
+    seed = f"{fragment_etag}|{session.get('csrf_token', '')}|{window}"
+    return hashlib.blake2b(seed.encode(), digest_size=12).hexdigest()
+
+
 @app.route('/')
 def index():
-    tasks = Task.query.all()
-    form = TaskForm()
-    return render_template('../templates/index.html', tasks=tasks, form=form)
+    view = request.args.get('view', 'all')
+    if view not in VIEWS:
+        view = 'all'
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+
+    _, html, fragment_etag = tasks_fragment(view, limit, after, before)
+    generate_csrf()  # Puts the session's CSRF secret in place before the ETag is computed
+    etag = page_etag(fragment_etag)
+    if request.if_none_match.contains(etag):
+        with fragments_lock:
+            fragment_stats['not_modified'] += 1
+        response = app.response_class(status=304)
+    else:
+        form = TaskForm()
+        response = app.make_response(render_template('index.html', form=form, view=view, tasks_html=Markup(html)))
+    # Browsers revalidate on every load and get a 304 while nothing changed
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    lookups = fragment_stats['hit'] + fragment_stats['miss']
+    return jsonify({**fragment_stats, 'version': current_version(), 'entries': len(fragments),
+                    'hit_ratio': fragment_stats['hit'] / lookups if lookups else 0.0})
 
 
 @app.route('/add', methods=['POST'])
@@ -39,6 +181,7 @@ def add_task():
     if form.validate_on_submit():
         new_task = Task(title=form.title.data)
         db.session.add(new_task)
+        bump_version()
         db.session.commit()
         flash('Task added successfully!', 'success')
     else:
@@ -46,23 +189,122 @@ def add_task():
     return redirect(url_for('index'))
 
 
+# One UPDATE ... RETURNING instead of a SELECT followed by the UPDATE
 @app.route('/toggle/<int:task_id>', methods=['POST'])
 def toggle_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    task.completed = not task.completed
+    completed = db.session.execute(
+        update(Task).where(Task.id == task_id).values(completed=not_(Task.completed)).returning(Task.completed)
+    ).scalar_one_or_none()
+    if completed is None:
+        abort(404)
+    bump_version()
     db.session.commit()
-    return jsonify({"status": "success", "completed": task.completed})
+    return jsonify({"status": "success", "completed": completed})
 
 
 @app.route('/delete/<int:task_id>', methods=['POST'])
 def delete_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    db.session.delete(task)
+    if db.session.execute(delete(Task).where(Task.id == task_id)).rowcount == 0:
+        abort(404)
+    bump_version()
     db.session.commit()
     flash('Task deleted successfully!', 'info')
-    return redirect(url_for('index'))
+    return redirect(request.referrer or url_for('index'))
+
+
+# Bulk endpoints take JSON {"ids": [...]} and run a single statement with WHERE id IN
+def bulk_ids():
+    data = request.get_json(silent=True)
+    ids = data.get('ids') if isinstance(data, dict) else None
+    if not isinstance(ids, list) or not all(type(task_id) is int for task_id in ids):
+        return None, (jsonify({"status": "error", "message": "ids must be a list of integers"}), 400)
+    if len(ids) > MAX_BULK_IDS:
+        return None, (jsonify({"status": "error", "message": f"at most {MAX_BULK_IDS} ids per request"}), 400)
+    return data, None
+
+
+# {"ids": [...]} flips each task; {"ids": [...], "completed": true} sets them all
+@app.route('/tasks/toggle', methods=['POST'])
+def toggle_tasks():
+    data, error = bulk_ids()
+    if error:
+        return error
+    completed = data.get('completed')
+    if completed is not None and not isinstance(completed, bool):
+        return jsonify({"status": "error", "message": "completed must be true, false or null"}), 400
+    value = not_(Task.completed) if completed is None else completed
+    updated = db.session.execute(
+        update(Task).where(Task.id.in_(data['ids'])).values(completed=value)
+    ).rowcount if data['ids'] else 0
+    if updated:
+        bump_version()
+    db.session.commit()
+    return jsonify({"status": "success", "updated": updated})
+
+
+@app.route('/tasks/delete', methods=['POST'])
+def delete_tasks():
+    data, error = bulk_ids()
+    if error:
+        return error
+    deleted = db.session.execute(delete(Task).where(Task.id.in_(data['ids']))).rowcount if data['ids'] else 0
+    if deleted:
+        bump_version()
+    db.session.commit()
+    return jsonify({"status": "success", "deleted": deleted})
+
+
+# flask --app app_p1 seed 1000000
+@app.cli.command('seed')
+@click.argument('count', type=int, default=1000000)
+def seed(count):
+    init_db()
+    batch = 50000
+    for start in range(0, count, batch):
+        db.session.execute(insert(Task), [
+            {'title': f'Task {i}', 'completed': i % 3 == 0} for i in range(start, min(start + batch, count))
+        ])
+    bump_version()
+    db.session.commit()
+    click.echo(f'{count} tasks added')
+
+
+# flask --app app_p1 bench 5000 100: page loads over 20 pages, a toggle every 100 requests,
+# and one browser in three revalidating with If-None-Match
+@app.cli.command('bench')
+@click.argument('requests', type=int, default=5000)
+@click.argument('write_every', type=int, default=100)
+def bench(requests, write_every):
+    client = app.test_client()
+    pages = [f'/?view={view}&after={after}' for view in VIEWS for after in range(0, 7000, 1000)][:20]
+    etags = {}
+    times = {'miss': [], 'hit': [], '304': []}
+    fragments.clear()
+    fragment_stats.update(hit=0, miss=0, not_modified=0)
+    for i in range(requests):
+        page = pages[i % len(pages)]
+        headers = {'If-None-Match': etags[page]} if i % 3 == 0 and page in etags else {}
+        misses = fragment_stats['miss']
+        start = time.perf_counter()
+        response = client.get(page, headers=headers)
+        elapsed = time.perf_counter() - start
+        if fragment_stats['miss'] > misses:
+            times['miss'].append(elapsed)
+        else:
+            times['304' if response.status_code == 304 else 'hit'].append(elapsed)
+        etags[page] = response.headers['ETag']
+        if i % write_every == write_every - 1:
+            client.post(f'/toggle/{i % 1000 + 1}')
+
+    lookups = fragment_stats['hit'] + fragment_stats['miss']
+    click.echo(f"hit ratio {fragment_stats['hit'] / lookups:.1%}  "
+               f"({fragment_stats['hit']} hits, {fragment_stats['miss']} misses, {fragment_stats['not_modified']} 304s)")
+    for name, samples in times.items():
+        if samples:
+            click.echo(f'{name:>4}: {len(samples):6} responses  mean {sum(samples) / len(samples) * 1000:.3f} ms')
 
 
 if __name__ == '__main__':
-    db.create_all()
+    with app.app_context():
+        init_db()
     app.run(debug=True)
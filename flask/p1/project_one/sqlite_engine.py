@@ -0,0 +1,132 @@
+"""
+SQLite PRAGMAs and pool options for the tasks database (app_p1.py).
+
+Stock SQLite uses a rollback journal and synchronous=FULL: every commit
+fsyncs the journal and the database, and a writer blocks every reader. The
+profiles change that per connection, on the pool's "connect" event:
+
+    default   SQLite as shipped (rollback journal, synchronous=FULL)
+    wal       WAL + synchronous=NORMAL: readers don't wait for the writer and
+              commits only fsync at checkpoints; a power loss can drop the
+              last commits but never corrupts the database
+    durable   WAL + synchronous=FULL: fsync of the WAL on every commit
+
+Flask-SQLAlchemy creates the engine itself, so the options go in the config
+and the PRAGMAs are hooked on afterwards:
+
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_engine.engine_options()
+    db = SQLAlchemy(app)
+    with app.app_context():
+        sqlite_engine.tune(db.engine, "wal")
+
+Concurrent write benchmark per profile: python sqlite_engine.py [threads] [writes]
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import sqlalchemy
+from sqlalchemy import event
+
+# PRAGMAs per profile; a negative cache_size is in KiB
+PROFILES = {
+    "default": {},
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,  # 64 MB page cache per connection
+        "mmap_size": 256 * 1024 * 1024,  # Reads straight from the OS page cache
+        "temp_store": "MEMORY",
+    },
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+POOL_SIZE = 5  # Connections kept open
+MAX_OVERFLOW = 10  # Extra connections under load, closed when returned to the pool
+BUSY_TIMEOUT = 30  # Seconds to wait for the write lock before "database is locked"
+
+
+# create_engine options: connection pool and waiting for the write lock
+def engine_options(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, busy_timeout=BUSY_TIMEOUT):
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": busy_timeout,
+        "connect_args": {"timeout": busy_timeout, "check_same_thread": False},
+    }
+
+
+# Applies the profile's PRAGMAs to every new connection the engine opens
+def tune(engine, profile="wal"):
+    if profile not in PROFILES:
+        raise ValueError(f"invalid SQLite profile: {profile} (use {', '.join(PROFILES)})")
+    pragmas = PROFILES[profile]
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    return engine
+
+
+# Each thread is a request: takes a pooled connection, writes a row and commits
+def bench(threads, writes):
+    from sqlalchemy import Column, Integer, String
+    from sqlalchemy.orm import declarative_base, sessionmaker
+
+    Base = declarative_base()
+
+    class Row(Base):
+        __tablename__ = "rows"
+        id = Column(Integer, primary_key=True)
+        payload = Column(String)
+
+    directory = tempfile.mkdtemp()
+    for profile in PROFILES:
+        path = os.path.join(directory, f"{profile}.db")
+        engine = tune(sqlalchemy.create_engine(f"sqlite:///{path}", **engine_options(pool_size=threads)), profile)
+        Base.metadata.create_all(engine)
+        Session = sessionmaker(bind=engine)
+        latencies = []
+
+        def writer():
+            for i in range(writes):
+                start = time.perf_counter()
+                with Session() as session:
+                    session.add(Row(payload=f"message {i}"))
+                    session.commit()
+                latencies.append(time.perf_counter() - start)
+
+        workers = [threading.Thread(target=writer) for _ in range(threads)]
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - start
+        engine.dispose()
+
+        latencies.sort()
+        total = threads * writes
+        print(f"{profile:<8} {total / elapsed:8.0f} commits/s   "
+              f"p50 {latencies[total // 2] * 1000:6.2f} ms   p99 {latencies[int(total * 0.99)] * 1000:6.2f} ms")
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    os.rmdir(directory)
+
+
+if __name__ == "__main__":
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 8,
+          int(sys.argv[2]) if len(sys.argv) > 2 else 250)
@@ -11,4 +11,28 @@ document.addEventListener('DOMContentLoaded', () => {
                 });
         });
     });
+
+    const selectedIds = () =>
+        Array.from(document.querySelectorAll('.select:checked')).map(box => Number(box.value));
+
+    const bulk = (url) => {
+        const ids = selectedIds();
+        if (ids.length === 0) {
+            return;
+        }
+        fetch(url, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ids })
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status === 'success') {
+                    location.reload();
+                }
+            });
+    };
+
+    document.querySelector('.bulk-toggle').addEventListener('click', () => bulk('/tasks/toggle'));
+    document.querySelector('.bulk-delete').addEventListener('click', () => bulk('/tasks/delete'));
 });